@@ -0,0 +1,152 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne
+from datetime import datetime, timedelta
+import asyncio
+import os
+from dotenv import load_dotenv
+from response_cache import bump_data_version
+from image_store import IMAGE_COLLECTION, release_operations
+
+# Load environment variables
+load_dotenv()
+
+# MongoDB connection
+MONGODB_URL = os.getenv("MONGODB_URL", "connection_url_string")
+client = AsyncIOMotorClient(MONGODB_URL)
+db = client.discount_hunter
+
+ARCHIVE_COLLECTION = "discounts_archive"
+BATCH_SIZE = 1000
+
+async def ensure_indexes():
+    """Create the indexes archival relies on"""
+    # Serves both the expiry scan here and the live-offer filter in the API
+    await db.discounts.create_index("offer_end_date")
+    archive = db[ARCHIVE_COLLECTION]
+    # Archive entries used to expire through a TTL index, whose deletions
+    # leave no tombstones; purge_archive replaces it
+    info = await archive.index_information()
+    if "expireAfterSeconds" in info.get("archived_at_1", {}):
+        await archive.drop_index("archived_at_1")
+    await archive.create_index("archived_at")
+    # Incremental backups find newly archived offers by updated_at
+    await archive.create_index("updated_at")
+
+async def archive_expired(batch_size=BATCH_SIZE, now=None):
+    """Move expired offers to the archive in bulk batches.
+
+    Each batch is copied first and deleted second, so an interrupted run
+    leaves duplicates in the archive at worst, and those are overwritten
+    by the upsert next time. Cart rows pointing at archived offers are
+    removed with them.
+    """
+    now = now or datetime.utcnow()
+    archive = db[ARCHIVE_COLLECTION]
+    archived = removed_cart_items = 0
+    
+    while True:
+        batch = await db.discounts.find(
+            {"offer_end_date": {"$lt": now}}
+        ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        
+        await archive.bulk_write(
+            # Archived offers keep their old _id, so incremental backups
+            # need updated_at to see them
+            [ReplaceOne({"_id": doc["_id"]}, {**doc, "archived_at": now, "updated_at": now}, upsert=True)
+             for doc in batch],
+            ordered=False
+        )
+        
+        ids = [doc["_id"] for doc in batch]
+        cart_items = await db.shopping_cart.find(
+            {"discount_id": {"$in": [str(_id) for _id in ids]}}, {"_id": 1}
+        ).to_list(length=None)
+        cart_ids = [item["_id"] for item in cart_items]
+        
+        await db.discounts.delete_many({"_id": {"$in": ids}})
+        # Archived offers are not shown, so their crops may be collected
+        releases = release_operations([doc.get("image_id") for doc in batch], now)
+        if releases:
+            await db[IMAGE_COLLECTION].bulk_write(releases, ordered=False)
+        if cart_ids:
+            await db.shopping_cart.delete_many({"_id": {"$in": cart_ids}})
+        
+        # Record the deletions so incremental backups can replay them
+        tombstones = [
+            {"collection": "discounts", "doc_id": _id, "deleted_at": now} for _id in ids
+        ] + [
+            {"collection": "shopping_cart", "doc_id": _id, "deleted_at": now} for _id in cart_ids
+        ]
+        await db.backup_tombstones.insert_many(tombstones, ordered=False)
+        
+        archived += len(ids)
+        removed_cart_items += len(cart_ids)
+        print(f"Archived {archived} expired offers so far")
+    
+    if archived:
+        await bump_data_version(db)
+    print(f"Archived {archived} expired offers and removed {removed_cart_items} cart items")
+    return archived
+
+async def purge_archive(ttl_days, batch_size=BATCH_SIZE, now=None):
+    """Delete archived offers older than `ttl_days`.
+
+    Done here rather than by a TTL index so every deletion gets a tombstone
+    and incremental restores do not bring purged offers back.
+    """
+    now = now or datetime.utcnow()
+    archive = db[ARCHIVE_COLLECTION]
+    cutoff = now - timedelta(days=ttl_days)
+    purged = 0
+    
+    while True:
+        batch = await archive.find(
+            {"archived_at": {"$lt": cutoff}}, {"_id": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        ids = [doc["_id"] for doc in batch]
+        await archive.delete_many({"_id": {"$in": ids}})
+        await db.backup_tombstones.insert_many(
+            [{"collection": ARCHIVE_COLLECTION, "doc_id": _id, "deleted_at": now} for _id in ids],
+            ordered=False
+        )
+        purged += len(ids)
+    
+    print(f"Purged {purged} archived offers older than {ttl_days:g} days")
+    return purged
+
+async def run_once(ttl_days=None):
+    await archive_expired()
+    if ttl_days:
+        await purge_archive(ttl_days)
+
+async def run_forever(interval, ttl_days=None):
+    """Archive on a fixed schedule"""
+    while True:
+        try:
+            await ensure_indexes()
+            await run_once(ttl_days)
+        except Exception as e:
+            print(f"Error archiving expired offers: {str(e)}")
+        await asyncio.sleep(interval)
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Move expired offers to discounts_archive")
+    parser.add_argument("--interval", type=float, default=None,
+                        help="keep running, archiving every INTERVAL seconds")
+    parser.add_argument("--ttl-days", type=float, default=None,
+                        help="delete archived offers this many days after archival")
+    args = parser.parse_args()
+    
+    if args.interval:
+        asyncio.run(run_forever(args.interval, args.ttl_days))
+    else:
+        async def main():
+            await ensure_indexes()
+            await run_once(args.ttl_days)
+        asyncio.run(main())
@@ -0,0 +1,114 @@
+"""Backup file formats shared by export_db and restore_db.
+
+Two layouts are supported:
+
+* ``json``: the original indented JSON array. ObjectIds and datetimes are
+  written as strings, so only the fields restore_db knows about come back
+  with their native types.
+* ``bson``: the ``mongodump`` layout, a stream of length-prefixed BSON
+  documents, gzip-compressed like ``mongodump --gzip``. Every value decodes
+  back to its exact type and the file can be fed to ``mongorestore --gzip``.
+"""
+import gzip
+import json
+from datetime import datetime
+
+import bson
+from bson import ObjectId
+from bson.errors import InvalidId
+
+FORMATS = ('json', 'bson')
+
+# Dates stored by the API and the catalog processor; JSON backups lose their type
+JSON_DATE_FIELDS = ('offer_start_date', 'offer_end_date', 'added_date', 'updated_at', 'archived_at')
+
+
+class JSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, ObjectId):
+            return str(obj)
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+def file_extension(fmt):
+    """Return the file extension used for a backup format"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown backup format: {fmt}")
+    return '.bson.gz' if fmt == 'bson' else '.json'
+
+
+def detect_format(filename):
+    """Infer the backup format from a backup filename"""
+    return 'bson' if filename.endswith(('.bson', '.bson.gz')) else 'json'
+
+
+class BackupWriter:
+    """Write documents to a backup file one at a time.
+
+    JSON backups are written as the same indented array ``json.dump`` would
+    produce, but element by element, so no format buffers the collection.
+    """
+
+    def __init__(self, filename, fmt='json'):
+        self.filename = filename
+        self.fmt = fmt
+        self.count = 0
+        if fmt == 'bson':
+            self._file = gzip.open(filename, 'wb', compresslevel=6)
+        else:
+            self._file = open(filename, 'w', encoding='utf-8')
+            self._file.write('[')
+
+    def write(self, doc):
+        if self.fmt == 'bson':
+            self._file.write(bson.encode(doc))
+        else:
+            if 'bounding_box' in doc and doc['bounding_box']:
+                doc['bounding_box'] = dict(doc['bounding_box'])
+            body = json.dumps(doc, ensure_ascii=False, indent=2, cls=JSONEncoder)
+            self._file.write(('\n  ' if self.count == 0 else ',\n  ') + body.replace('\n', '\n  '))
+        self.count += 1
+
+    def close(self):
+        if self.fmt == 'json':
+            self._file.write('\n]' if self.count else ']')
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def decode_id(value):
+    """Turn a serialized _id back into an ObjectId when it was one"""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return value
+
+
+def decode_json_document(doc):
+    """Convert string IDs and ISO dates in a JSON backup document back to native types"""
+    if '_id' in doc:
+        doc['_id'] = decode_id(doc['_id'])
+    for field in JSON_DATE_FIELDS:
+        if doc.get(field):
+            doc[field] = datetime.fromisoformat(doc[field])
+    return doc
+
+
+def iter_documents(filename):
+    """Yield the documents stored in a backup file, with native types restored"""
+    if detect_format(filename) == 'bson':
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'rb') as f:
+            yield from bson.decode_file_iter(f)
+        return
+    with open(filename, 'r', encoding='utf-8') as f:
+        documents = json.load(f)
+    for doc in documents:
+        yield decode_json_document(doc)
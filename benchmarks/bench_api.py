@@ -0,0 +1,232 @@
+"""HTTP load benchmark for every main.py endpoint.
+
+Seeds a local mongod with a known dataset (db_config.init_database), starts
+the API with uvicorn against it and drives each endpoint at the configured
+concurrency. Latency percentiles and throughput are printed as JSON and can
+be compared against an earlier run to catch regressions:
+
+    python -m benchmarks.bench_api --discounts 200000 --output run.json
+    python -m benchmarks.bench_api --skip-seed --compare run.json
+
+The seed step clears the target database, so only local URLs are accepted
+unless --allow-remote is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+import httpx
+
+SORTS = [None, "price", "store", "date", "trending"]
+FILTERS = {
+    "none": {},
+    "query": {"query": "mleko"},
+    "store": {"store": "Lidl"},
+    "min_discount": {"min_discount": 30},
+    "max_price": {"max_price": 5},
+    "combined": {"query": "kruh", "store": "Spar", "min_discount": 20, "max_price": 3},
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, wall_seconds):
+    latencies.sort()
+    to_ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "mean_ms": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+        "throughput_rps": round(len(latencies) / wall_seconds, 1) if wall_seconds else None,
+    }
+
+
+async def drive(client, make_request, total, concurrency):
+    """Issue `total` requests from `concurrency` workers and summarize them"""
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - started
+                if response.status_code >= 500:
+                    errors += 1
+                else:
+                    latencies.append(elapsed)
+            except httpx.HTTPError:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def build_scenarios(discount_ids):
+    scenarios = {}
+    for sort_by in SORTS:
+        for filter_name, params in FILTERS.items():
+            query = dict(params, limit=50)
+            if sort_by:
+                query["sort_by"] = sort_by
+            name = f"search[sort={sort_by or 'none'},filter={filter_name}]"
+            scenarios[name] = lambda i, q=query: ("GET", "/api/search", {"params": q})
+
+    scenarios["trending"] = lambda i: ("GET", "/api/trending", {"params": {"limit": 10}})
+
+    # Each request uses its own bench user so adds never hit "already in cart"
+    scenarios["cart_add"] = lambda i: ("POST", "/api/shopping-cart", {"json": {
+        "user_id": f"bench_user_{i}",
+        "discount_id": discount_ids[i % len(discount_ids)],
+    }})
+    scenarios["cart_get"] = lambda i: ("GET", f"/api/shopping-cart/bench_user_{i}", {})
+    scenarios["cart_remove"] = lambda i: (
+        "DELETE", f"/api/shopping-cart/bench_user_{i}/{discount_ids[i % len(discount_ids)]}", {}
+    )
+    scenarios["notification_save"] = lambda i: ("POST", "/api/notifications", {"json": {
+        "user_id": f"bench_user_{i}", "device_id": f"bench_device_{i}",
+    }})
+    scenarios["notification_get"] = lambda i: ("GET", f"/api/notifications/bench_user_{i}", {})
+    return scenarios
+
+
+async def seed(args):
+    # db_config builds its client at import time from MONGODB_URL
+    os.environ["MONGODB_URL"] = args.mongodb_url
+    import db_config
+
+    reference_date = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    await db_config.init_database(
+        num_discounts=args.discounts,
+        num_cart_items=args.discounts // 10,
+        num_notifications=args.discounts // 100,
+        seed=args.seed,
+        reference_date=reference_date,
+    )
+    return reference_date.isoformat()
+
+
+def start_server(args):
+    env = dict(os.environ, MONGODB_URL=args.mongodb_url)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(args.port), "--log-level", "warning"],
+        env=env,
+    )
+
+
+async def wait_until_ready(client, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API did not become ready")
+
+
+def compare(results, baseline_path, tolerance):
+    """Return the scenarios whose p95 regressed by more than `tolerance`"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["scenarios"]
+    regressions = {}
+    for name, current in results.items():
+        before = baseline.get(name, {}).get("p95_ms")
+        if before and current["p95_ms"] and current["p95_ms"] > before * (1 + tolerance):
+            regressions[name] = {"baseline_p95_ms": before, "p95_ms": current["p95_ms"]}
+    return regressions
+
+
+async def run(args):
+    meta = {
+        "started_at": datetime.utcnow().isoformat(),
+        "discounts": args.discounts,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "requests_per_scenario": args.requests,
+    }
+    if not args.skip_seed:
+        meta["reference_date"] = await seed(args)
+
+    server = start_server(args)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}",
+                                     limits=limits, timeout=60) as client:
+            await wait_until_ready(client)
+            response = await client.get("/api/search", params={"limit": 1000})
+            discount_ids = [item["_id"] for item in response.json()["items"]]
+            if not discount_ids:
+                raise RuntimeError("Database is empty, run without --skip-seed")
+
+            results = {}
+            for name, make_request in build_scenarios(discount_ids).items():
+                # Warm up connections and caches before measuring; writes are
+                # not repeated since a second add of the same row fails
+                if make_request(0)[0] == "GET":
+                    await drive(client, make_request, min(args.concurrency, args.requests), args.concurrency)
+                results[name] = await drive(client, make_request, args.requests, args.concurrency)
+                print(f"{name}: p95={results[name]['p95_ms']} ms", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {"meta": meta, "scenarios": results}
+    if args.compare:
+        report["regressions"] = compare(results, args.compare, args.tolerance)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongodb-url", default="mongodb://localhost:27017")
+    parser.add_argument("--allow-remote", action="store_true")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--discounts", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative p95 increase before flagging a regression")
+    args = parser.parse_args()
+
+    host = urlparse(args.mongodb_url).hostname
+    if host not in ("localhost", "127.0.0.1", "::1") and not args.allow_remote:
+        parser.error("refusing to seed a non-local database without --allow-remote")
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Round-trip speed of the JSON and BSON backup formats.
+
+Generates synthetic discount documents, writes them with each backup
+format and reads them back the way restore_db does. No database needed.
+
+    python -m benchmarks.bench_backup_format --docs 200000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from backup_format import BackupWriter, file_extension, iter_documents
+
+
+def make_documents(count, seed=42):
+    rng = random.Random(seed)
+    now = datetime(2025, 4, 10)
+    stores = ["Lidl", "Hofer", "Spar", "Mercator", "Eurospin"]
+    documents = []
+    for i in range(count):
+        start = now - timedelta(days=rng.randint(0, 7))
+        documents.append({
+            "_id": ObjectId(),
+            "item_description": f"Product {i}",
+            "discount_price": round(rng.uniform(0.5, 30), 2),
+            "discount_percentage": rng.choice([None, 10.0, 20.0, 30.0]),
+            "store": rng.choice(stores),
+            "offer_start_date": start,
+            "offer_end_date": start + timedelta(days=14),
+            "trending_score": rng.randint(0, 50),
+            "quantity": rng.choice(["za kg", "400 g", "1 l"]),
+            "discount_id": ObjectId(),
+            "bounding_box": {"x": rng.randint(0, 5000), "y": rng.randint(0, 7000),
+                             "width": 1200, "height": 1500},
+        })
+    return documents
+
+
+def run(fmt, documents, directory):
+    filename = os.path.join(directory, f"discounts{file_extension(fmt)}")
+
+    started = time.perf_counter()
+    with BackupWriter(filename, fmt) as writer:
+        # The JSON writer stringifies in place, so hand it copies
+        for doc in documents:
+            writer.write(dict(doc))
+    encode_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    restored = list(iter_documents(filename))
+    decode_seconds = time.perf_counter() - started
+
+    # Count fields that did not come back with their original type
+    lost_types = sum(
+        1
+        for original, decoded in zip(documents, restored)
+        for key, value in original.items()
+        if type(decoded.get(key)) is not type(value)
+    )
+
+    return {
+        "format": fmt,
+        "documents": len(restored),
+        "file_bytes": os.path.getsize(filename),
+        "encode_seconds": round(encode_seconds, 3),
+        "decode_seconds": round(decode_seconds, 3),
+        "fields_with_lost_type": lost_types,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=100_000)
+    args = parser.parse_args()
+
+    documents = make_documents(args.docs)
+    with tempfile.TemporaryDirectory() as directory:
+        results = [run(fmt, documents, directory) for fmt in ("json", "bson")]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
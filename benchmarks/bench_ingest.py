@@ -0,0 +1,225 @@
+"""Offline benchmark of CatalogProcessor ingestion stages.
+
+Runs process_catalog on a generated fixture PDF with FakeModelClient and an
+in-memory collection, so neither Gemini nor MongoDB is needed. Reports wall
+time and peak RSS for each stage: render, text layer, encode, detect, crop,
+summary and store, plus the share of pages the text layer answered without
+a model call (``--no-text-layer`` sends every page to the model) and the
+image store's reuse rate (``--repeat 2`` ingests the catalog twice).
+Model failures, truncated answers and hanging calls can be injected to see
+how retries, deadlines and ``--hedge`` shape the model latency tail.
+
+    python -m benchmarks.bench_ingest --pages 10 --latency 2.0
+"""
+import argparse
+import functools
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from benchmarks.fixture_pdfs import make_catalog_pdf
+from catalog_processor import CatalogProcessor
+from fake_model_client import FakeModelClient
+
+# Method on CatalogProcessor timed for each reported stage
+STAGES = {
+    "render": "_convert_pdf_to_images",
+    "text_layer": "_read_text_layers",
+    "tiles": "_build_tiles",
+    "encode": "_encode_image",
+    "detect": "_request_detections",
+    "crop": "save_product_image",
+    "summary": "create_summary_image",
+    "store": "_store_product",
+}
+
+
+class InMemoryCollection:
+    """The handful of pymongo collection methods the processor uses"""
+
+    def __init__(self):
+        self.documents = []
+
+    def insert_one(self, document):
+        document.setdefault("_id", ObjectId())
+        self.documents.append(document)
+
+    def update_one(self, query, update, upsert=False):
+        # $set and $inc are all the image store and version bump use
+        document = self.find_one(query)
+        if document is None:
+            return SimpleNamespace(matched_count=0)
+        document.update(update.get("$set", {}))
+        for key, amount in update.get("$inc", {}).items():
+            document[key] = document.get(key, 0) + amount
+        return SimpleNamespace(matched_count=1)
+
+    @staticmethod
+    def _matches(document, key, value):
+        if isinstance(value, dict) and "$in" in value:
+            field = document.get(key)
+            return any(item in value["$in"] for item in (field if isinstance(field, list) else [field]))
+        return document.get(key) == value
+
+    def find(self, query=None):
+        query = query or {}
+        return [d for d in self.documents if all(self._matches(d, k, v) for k, v in query.items())]
+
+    def find_one(self, query=None):
+        matches = self.find(query)
+        return matches[0] if matches else None
+
+
+class InMemoryDB(defaultdict):
+    def __init__(self):
+        super().__init__(InMemoryCollection)
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the lifetime peak (KiB on Linux, bytes on macOS)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+class RSSSampler:
+    """Samples RSS in the background; stages read the peak seen while they ran"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def reset(self):
+        self.peak = current_rss()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def instrument(processor, sampler):
+    """Wrap each stage method on the instance to record time and peak RSS"""
+    stats = {stage: {"calls": 0, "seconds": 0.0, "peak_rss_bytes": 0} for stage in STAGES}
+
+    for stage, method_name in STAGES.items():
+        method = getattr(processor, method_name)
+
+        @functools.wraps(method)
+        def timed(*args, _stage=stage, _method=method, **kwargs):
+            sampler.reset()
+            started = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                entry = stats[_stage]
+                entry["calls"] += 1
+                entry["seconds"] += time.perf_counter() - started
+                entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"], sampler.peak, current_rss())
+
+        setattr(processor, method_name, timed)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the fake model waits before answering")
+    parser.add_argument("--pdf", help="use an existing PDF instead of a generated fixture")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="ingest the catalog this many times, like weekly catalogs reusing photos")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of model calls that raise")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="share of model answers cut off mid-JSON")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of model calls that hang")
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    parser.add_argument("--deadline", type=float, default=120.0, help="seconds before an attempt is abandoned")
+    parser.add_argument("--hedge", action="store_true", help="send a duplicate request after the p95 latency")
+    parser.add_argument("--no-text-layer", action="store_true",
+                        help="send every page to the model, ignoring the PDF text layer")
+    parser.add_argument("--no-tiles", action="store_true", help="skip building the deep-zoom page tiles")
+    parser.add_argument("--tile-workers", type=int, default=None, help="threads encoding tiles (default: CPU count)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.abspath(args.pdf) if args.pdf else make_catalog_pdf(os.path.join(workdir, "fixture.pdf"), args.pages)
+        os.chdir(workdir)
+
+        db = InMemoryDB()
+        processor = CatalogProcessor(
+            offer_start_date="2025-04-10",
+            offer_end_date="2025-04-20",
+            max_pages=args.pages,
+            model_client=FakeModelClient(
+                latency=args.latency, failure_rate=args.failure_rate, malformed_rate=args.malformed_rate,
+                slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+            ),
+            model_options={"deadline": args.deadline, "hedge": args.hedge, "hedge_min_samples": 5,
+                           "base_delay": 0.1},
+            db=db,
+            use_text_layer=not args.no_text_layer,
+            build_tiles=not args.no_tiles,
+            tile_workers=args.tile_workers,
+        )
+        with RSSSampler() as sampler:
+            stats = instrument(processor, sampler)
+            started = time.perf_counter()
+            try:
+                # Each run's summary only covers that run, so the totals are summed here
+                counters = Counter()
+                for _ in range(args.repeat):
+                    counters.update(processor.process_catalog("Bench", pdf_path)["counters"])
+            finally:
+                processor.cleanup()
+            wall = time.perf_counter() - started
+
+    skipped = counters.get("pages_text_layer", 0)
+    reused = counters.get("images_reused", 0)
+    pages = skipped + counters.get("pages_hybrid", 0) + counters.get("pages_model", 0)
+    for entry in stats.values():
+        entry["seconds"] = round(entry["seconds"], 4)
+    report = {
+        "pages": args.pages,
+        "model_latency_seconds": args.latency,
+        "products_stored": len(db.discounts.documents),
+        "model_requests": processor.client.calls,
+        "model": processor.model_client.stats(),
+        "pages_skipped_model": round(skipped / max(1, pages), 3),
+        "images_stored": counters.get("images_stored", 0),
+        "image_reuse_rate": round(reused / max(1, reused + counters.get("images_stored", 0)), 3),
+        "tiles": counters.get("tiles", 0),
+        "tile_bytes": counters.get("tile_bytes", 0),
+        "wall_seconds": round(wall, 3),
+        "peak_rss_bytes": max(entry["peak_rss_bytes"] for entry in stats.values()),
+        "stages": stats,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Per-page cost of turning model detections into products.
+
+Generates pages with 100+ detections, a share of them near-duplicate boxes
+like the ones Gemini emits, and times the vectorized post-processing
+(scale, clip, IoU suppression, memoized dates) against the per-detection
+loop it replaced. The old loop keeps every duplicate, so its product count
+is higher.
+
+    python -m benchmarks.bench_postprocess --detections 100 250 500
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from detection_postprocess import OfferDateParser, postprocess
+from fake_model_client import PRODUCT_NAMES, QUANTITIES
+
+WIDTH, HEIGHT = 2480, 3508  # A4 rendered at 300 dpi
+VALIDITY = ["10.4.-16.4.", "10.4.-23.4.", "17.4.", "10.-16.4.2025"]
+
+
+def make_page(count, duplicate_share, rng):
+    """`count` detections on a grid, `duplicate_share` of them jittered copies"""
+    originals = max(1, round(count * (1 - duplicate_share)))
+    cols = max(1, round(originals ** 0.5))
+    rows = -(-originals // cols)
+    cell_w, cell_h = 1000 / cols, 1000 / rows
+    detections = []
+    for n in range(originals):
+        r, c = divmod(n, cols)
+        detections.append({
+            "ymin": r * cell_h + 5, "xmin": c * cell_w + 5,
+            "ymax": (r + 1) * cell_h - 5, "xmax": (c + 1) * cell_w - 5,
+            "label": rng.choice(PRODUCT_NAMES),
+            "price": f"{rng.uniform(0.5, 15):.2f}",
+            "quantity": rng.choice(QUANTITIES),
+            "description": "",
+            "discount": rng.choice(["", "-20%", "-30%"]),
+            "validity_date": rng.choice(VALIDITY),
+        })
+    while len(detections) < count:
+        copy = dict(rng.choice(detections[:originals]))
+        jitter = min(cell_w, cell_h) * 0.03
+        for key in ("ymin", "xmin", "ymax", "xmax"):
+            copy[key] += rng.uniform(-jitter, jitter)
+        copy["discount"] = ""
+        detections.append(copy)
+    rng.shuffle(detections)
+    return detections
+
+
+def legacy_postprocess(detections, width, height, offer_start_date=None, offer_end_date=None):
+    """The loop _process_image used before: one detection at a time, no suppression"""
+    products = []
+    for detection in detections:
+        if any(key not in detection for key in ("ymin", "xmin", "ymax", "xmax")):
+            continue
+        ymin = int(detection['ymin'] / 1000 * height)
+        xmin = int(detection['xmin'] / 1000 * width)
+        ymax = int(detection['ymax'] / 1000 * height)
+        xmax = int(detection['xmax'] / 1000 * width)
+
+        validity_date = detection.get('validity_date', '')
+        start, end = offer_start_date, offer_end_date
+        if validity_date:
+            match = re.search(r'(\d{1,2})\.(\d{1,2})?.?-(\d{1,2})\.(\d{1,2})?(?:\.(\d{4}))?', validity_date)
+            if match:
+                start_day, start_month, end_day, end_month, year = match.groups()
+                year = year or "2025"
+                end_month = end_month or start_month
+                start_month = start_month or end_month
+                start = f"{year}-{int(start_month):02d}-{int(start_day):02d}"
+                end = f"{year}-{int(end_month):02d}-{int(end_day):02d}"
+            else:
+                match = re.search(r'(\d{1,2})\.(\d{1,2})?(?:\.(\d{4}))?', validity_date)
+                if match:
+                    day, month, year = match.groups()
+                    start = end = f"{year or '2025'}-{int(month or '4'):02d}-{int(day):02d}"
+
+        products.append({
+            "bbox": [xmin, ymin, xmax, ymax],
+            "name": detection.get('label', 'Unknown Product'),
+            "price": detection.get('price', 'Unknown Price'),
+            "offer_start_date": start,
+            "offer_end_date": end,
+        })
+    return products
+
+
+def vectorized_postprocess(detections, width, height, dates):
+    products, stats = postprocess(detections, width, height)
+    for product in products:
+        product["offer_start_date"], product["offer_end_date"] = dates.parse(product.pop("validity_date"))
+    return products, stats
+
+
+def timed(function, pages, repeat):
+    timings = []
+    for _ in range(repeat):
+        for page in pages:
+            started = time.perf_counter()
+            result = function(page)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return result, {
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 1),
+        "p95_us": round(timings[int(len(timings) * 0.95)] * 1e6, 1),
+    }
+
+
+def bench(count, duplicate_share, pages, repeat, rng):
+    page_list = [make_page(count, duplicate_share, rng) for _ in range(pages)]
+    # One date memo per catalog, as in CatalogProcessor
+    dates = OfferDateParser("2025-04-10", "2025-04-20")
+    legacy_products, legacy = timed(lambda page: legacy_postprocess(page, WIDTH, HEIGHT), page_list, repeat)
+    (products, stats), vectorized = timed(
+        lambda page: vectorized_postprocess(page, WIDTH, HEIGHT, dates), page_list, repeat)
+    return {
+        "detections_per_page": count,
+        "duplicate_share": duplicate_share,
+        "legacy": dict(legacy, products=len(legacy_products)),
+        "vectorized": dict(vectorized, products=len(products), suppressed=stats["suppressed"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--detections", type=int, nargs="+", default=[100, 250, 500])
+    parser.add_argument("--duplicate-share", type=float, default=0.15)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(json.dumps([bench(count, args.duplicate_share, args.pages, args.repeat, rng)
+                      for count in args.detections], indent=2))
+
+
+if __name__ == "__main__":
+    main()
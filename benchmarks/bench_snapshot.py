@@ -0,0 +1,113 @@
+"""Filter/sort search latency: columnar snapshot versus the Mongo path.
+
+Without --mongodb-url the snapshot is built from synthetic documents and
+timed alone. With it, live discounts are read from that database (seed it
+first with ``python db_config.py --discounts 1000000``) and every query is
+also run through main._search for comparison.
+
+    python -m benchmarks.bench_snapshot --docs 500000
+    python -m benchmarks.bench_snapshot --mongodb-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.bench_backup_format import make_documents
+from snapshot_engine import DiscountSnapshot, SORT_KEYS
+
+FILTERS = [
+    {},
+    {"store": "Lidl"},
+    {"min_discount": 30},
+    {"max_price": 5},
+    {"store": "Spar", "min_discount": 20, "max_price": 3},
+]
+
+
+def queries():
+    for filters, sort_by in itertools.product(FILTERS, (None,) + SORT_KEYS):
+        yield dict(filters, sort_by=sort_by, limit=50, offset=0)
+
+
+def percentile_ms(timings, q):
+    timings = sorted(timings)
+    return round(timings[min(len(timings) - 1, int(len(timings) * q))] * 1000, 3)
+
+
+def time_sync(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def time_async(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await function()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def run(args):
+    main = None
+    if args.mongodb_url:
+        # main builds its client at import time from MONGODB_URL
+        os.environ["MONGODB_URL"] = args.mongodb_url
+        import main
+        now = datetime.utcnow()
+        documents = await main.db.discounts.find({"offer_end_date": {"$gt": now}}).to_list(length=None)
+    else:
+        documents = make_documents(args.docs)
+        # Shift the synthetic offers so they are live today
+        shift = datetime.utcnow() - datetime(2025, 4, 10)
+        for doc in documents:
+            doc["offer_start_date"] += shift
+            doc["offer_end_date"] += shift + timedelta(days=1)
+
+    started = time.perf_counter()
+    snapshot = DiscountSnapshot(documents)
+    build_seconds = time.perf_counter() - started
+
+    results = []
+    for query in queries():
+        snapshot_timings = time_sync(lambda: snapshot.search(**query), args.repeat)
+        entry = {
+            "query": query,
+            "snapshot_p50_ms": percentile_ms(snapshot_timings, 0.5),
+            "snapshot_p95_ms": percentile_ms(snapshot_timings, 0.95),
+        }
+        if main is not None:
+            mongo_timings = await time_async(lambda: main._search(
+                None, query.get("store"), query["sort_by"], query.get("min_discount"),
+                query.get("max_price"), query["limit"], query["offset"]
+            ), args.repeat)
+            entry["mongo_p50_ms"] = percentile_ms(mongo_timings, 0.5)
+            entry["mongo_p95_ms"] = percentile_ms(mongo_timings, 0.95)
+        results.append(entry)
+
+    return {
+        "documents": len(snapshot),
+        "build_seconds": round(build_seconds, 3),
+        "queries": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--mongodb-url", default=None)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Latency of typo-tolerant name search with the trigram index.
+
+Builds indexes of synthetic Slovene product names (with variants and
+OCR-style typos) and times queries that contain typos of their own.
+
+    python -m benchmarks.bench_trigram --sizes 100000 1000000
+"""
+import argparse
+import json
+import random
+import time
+
+from fake_model_client import PRODUCT_NAMES
+from trigram_index import TrigramIndex
+
+PREFIXES = ["", "", "Bio ", "Domači ", "Sveži ", "Premium ", "Mini ", "Slovenski "]
+SUFFIXES = ["", "", " light", " classic", " XXL", " s česnom", " naravni", " 2x"]
+BRANDS = ["", "", "Ljubljanske mlekarne ", "Kras ", "Pivka ", "Žito ", "Droga ", "Perutnina Ptuj "]
+
+
+def typo(rng, text):
+    """Apply one OCR/keyboard-style mistake"""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text[:i] + rng.choice("aeiourlnst") + text[i + 1:]
+
+
+def make_names(count, rng):
+    names = []
+    for n in range(count):
+        name = f"{rng.choice(BRANDS)}{rng.choice(PREFIXES)}{rng.choice(PRODUCT_NAMES)}{rng.choice(SUFFIXES)} {n % 997}"
+        names.append(typo(rng, name) if rng.random() < 0.2 else name)
+    return names
+
+
+def bench(size, queries, threshold, rng):
+    names = make_names(size, rng)
+    index = TrigramIndex()
+    started = time.perf_counter()
+    for doc_id, name in enumerate(names):
+        index.add(doc_id, name)
+    build_seconds = time.perf_counter() - started
+
+    timings = []
+    results = 0
+    for query in queries:
+        started = time.perf_counter()
+        results += len(index.search(query, threshold=threshold, limit=50))
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        "names": size,
+        "build_seconds": round(build_seconds, 2),
+        "queries": len(queries),
+        "mean_results": round(results / len(queries), 1),
+        "p50_ms": round(timings[len(timings) // 2] * 1000, 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threshold", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    queries = [typo(rng, rng.choice(PRODUCT_NAMES)).lower() for _ in range(args.queries)]
+    print(json.dumps([bench(size, queries, args.threshold, rng) for size in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
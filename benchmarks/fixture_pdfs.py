@@ -0,0 +1,65 @@
+"""Generate synthetic catalog PDFs for offline ingestion benchmarks.
+
+Each page has a grid of product tiles (a coloured "photo", a name, a red
+price box and a validity line) matching the boxes returned by
+FakeModelClient, and a real text layer like most retailer PDFs.
+
+    python -m benchmarks.fixture_pdfs --pages 20 catalogs/fixture.pdf
+"""
+import argparse
+import random
+import unicodedata
+
+import fitz
+
+from fake_model_client import GRID_COLS, GRID_ROWS, PRODUCT_NAMES, QUANTITIES, grid_boxes
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+
+
+def _latin(text):
+    """Fold letters like č to c, the Base-14 PDF fonts cannot draw them"""
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def make_catalog_pdf(path, pages, rows=GRID_ROWS, cols=GRID_COLS, seed=0,
+                     validity_date="10.4.-16.4."):
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        for ymin, xmin, ymax, xmax in grid_boxes(rows, cols):
+            x0, y0 = xmin / 1000 * PAGE_WIDTH, ymin / 1000 * PAGE_HEIGHT
+            x1, y1 = xmax / 1000 * PAGE_WIDTH, ymax / 1000 * PAGE_HEIGHT
+            height = y1 - y0
+
+            photo = fitz.Rect(x0, y0, x1, y0 + height * 0.55)
+            colour = (rng.random(), rng.random(), rng.random())
+            page.draw_rect(photo, color=colour, fill=colour)
+
+            page.insert_text((x0 + 4, y0 + height * 0.65), _latin(rng.choice(PRODUCT_NAMES)), fontsize=11)
+            page.insert_text((x0 + 4, y0 + height * 0.74), rng.choice(QUANTITIES), fontsize=7)
+
+            price_box = fitz.Rect(x1 - 60, y0 + height * 0.78, x1 - 4, y1 - 4)
+            page.draw_rect(price_box, color=(0.85, 0, 0), fill=(0.85, 0, 0))
+            price = f"{rng.uniform(0.5, 15):.2f}".replace(".", ",")
+            page.insert_text((price_box.x0 + 4, price_box.y1 - 6), price, fontsize=14, color=(1, 1, 1))
+
+            page.insert_text((x0 + 4, y1 - 6), validity_date, fontsize=6)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_catalog_pdf(args.output, args.pages, seed=args.seed)
+    print(f"Wrote {args.pages} pages to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
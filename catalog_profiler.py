@@ -0,0 +1,161 @@
+"""Stage-level instrumentation for CatalogProcessor.
+
+Stages are timed with ``profiler.stage(name)`` (or the ``@profiled``
+decorator on a processor method) and can be annotated with bytes in/out,
+model token usage, model call attempts and product counts. Every finished stage is emitted as a
+JSON line to the configured sink and passed to any registered callbacks;
+``summary()`` aggregates them for the whole run; ``reset()`` starts a new one.
+
+A single page can be run under cProfile by passing ``profile_page``.
+"""
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+ANNOTATION_FIELDS = ("bytes_in", "bytes_out", "prompt_tokens", "output_tokens", "products",
+                     "attempts", "hedges")
+
+
+class CatalogProfiler:
+    def __init__(self, sink=None, callbacks=None, profile_page=None, profile_dir="profiles"):
+        # `sink` is a path, a writable file object, "-" for stdout, or None to
+        # only aggregate in memory
+        self._owns_sink = isinstance(sink, str) and sink != "-"
+        if sink == "-":
+            sink = sys.stdout
+        elif self._owns_sink:
+            sink = open(sink, "a", encoding="utf-8")
+        self.sink = sink
+        self.callbacks = list(callbacks or [])
+        self.profile_page = profile_page
+        self.profile_dir = profile_dir
+        self.page_number = None
+        self.counters = {}
+        self._stack = []
+        self._stages = {}
+
+    def add_callback(self, callback):
+        """Call `callback(record)` with every finished stage record"""
+        self.callbacks.append(callback)
+
+    def _emit(self, record):
+        if self.sink is not None:
+            self.sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+        for callback in self.callbacks:
+            callback(record)
+
+    @contextmanager
+    def stage(self, name, **fields):
+        record = {"event": "stage", "stage": name, "page": self.page_number}
+        record.update(fields)
+        self._stack.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            self._stack.pop()
+            self._aggregate(record)
+            self._emit(record)
+
+    def annotate(self, **fields):
+        """Add numeric fields to the innermost running stage"""
+        if not self._stack:
+            return
+        record = self._stack[-1]
+        for key, value in fields.items():
+            if value is not None:
+                record[key] = record.get(key, 0) + value
+
+    def record_usage(self, response):
+        """Annotate the running stage with a model response's token usage"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.annotate(
+                prompt_tokens=getattr(usage, "prompt_token_count", None),
+                output_tokens=getattr(usage, "candidates_token_count", None),
+            )
+
+    def reset(self):
+        """Forget counters and stage stats, e.g. before the next catalog"""
+        self.counters = {}
+        self._stages = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def page(self, page_number):
+        """Mark the page being processed; runs it under cProfile if selected"""
+        self.page_number = page_number
+        profiler = None
+        if self.profile_page == page_number:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                os.makedirs(self.profile_dir, exist_ok=True)
+                path = os.path.join(self.profile_dir, f"page{page_number}.prof")
+                profiler.dump_stats(path)
+                print(f"Saved cProfile stats for page {page_number}: {path}")
+            self.page_number = None
+
+    def _aggregate(self, record):
+        stats = self._stages.setdefault(record["stage"], {"durations": [], "errors": 0})
+        stats["durations"].append(record["duration_ms"])
+        if "error" in record:
+            stats["errors"] += 1
+        for key in ANNOTATION_FIELDS:
+            if key in record:
+                stats[key] = stats.get(key, 0) + record[key]
+
+    def summary(self):
+        """Per-stage totals and latency percentiles for the run so far"""
+        stages = {}
+        for name, stats in self._stages.items():
+            durations = sorted(stats["durations"])
+            entry = {
+                "calls": len(durations),
+                "errors": stats["errors"],
+                "total_ms": round(sum(durations), 3),
+                "p50_ms": durations[len(durations) // 2],
+                "p95_ms": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                "max_ms": durations[-1],
+            }
+            entry.update((key, stats[key]) for key in ANNOTATION_FIELDS if key in stats)
+            stages[name] = entry
+        return {"event": "run_summary", "stages": stages, "counters": dict(self.counters)}
+
+    def emit_summary(self, **extra):
+        """Emit the summary, with any extra sections such as model call stats"""
+        summary = self.summary()
+        summary.update(extra)
+        self._emit(summary)
+        return summary
+
+    def close(self):
+        if self._owns_sink:
+            self.sink.close()
+        elif self.sink is not None:
+            self.sink.flush()
+
+
+def profiled(stage_name):
+    """Time a CatalogProcessor method as a stage on `self.profiler`"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.profiler.stage(stage_name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
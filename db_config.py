@@ -1,10 +1,15 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timedelta
 import asyncio
+import os
+import random
+import struct
+from concurrent.futures import ProcessPoolExecutor
 from bson import ObjectId
+from response_cache import bump_data_version
 
 # MongoDB connection
-MONGODB_URL = "connection_url_string"
+MONGODB_URL = os.getenv("MONGODB_URL", "connection_url_string")
 client = AsyncIOMotorClient(MONGODB_URL)
 db = client.discount_hunter
 
@@ -15,89 +20,204 @@ async def clear_database():
         await db[collection].delete_many({})
     print("Database cleared successfully")
 
-async def init_database():
-    """Initialize database with dummy data"""
-    # Clear existing data
-    await clear_database()
+# Slovene catalog vocabulary: (name, quantities, typical regular price range)
+PRODUCTS = [
+    ("Banane", ["za kg"], (1.2, 2.0)),
+    ("Jabolka Gala", ["za kg", "1 kg"], (1.0, 2.5)),
+    ("Mleko 3,5 % m.m.", ["1 l"], (0.9, 1.6)),
+    ("Trajno mleko", ["1 l", "6 x 1 l"], (0.8, 6.5)),
+    ("Jogurt", ["180 g", "500 g"], (0.4, 1.5)),
+    ("Sir Edamec", ["za kg", "400 g"], (3.5, 12.0)),
+    ("Maslo", ["250 g"], (2.0, 3.5)),
+    ("Jajca", ["10 kos"], (2.0, 3.8)),
+    ("Svinjski file", ["za kg"], (7.0, 12.0)),
+    ("Piščančje prsi", ["za kg", "500 g"], (4.0, 10.0)),
+    ("Goveji zrezki", ["za kg"], (12.0, 22.0)),
+    ("Pršut", ["100 g", "pribl. 1,3 kg"], (2.5, 25.0)),
+    ("Kraški pršut", ["100 g"], (2.5, 5.0)),
+    ("Orehova potica", ["400 g", "1 kg"], (3.5, 12.0)),
+    ("Kruh beli", ["500 g", "1 kg"], (0.9, 2.5)),
+    ("Polnozrnat kruh", ["500 g"], (1.2, 2.8)),
+    ("Bučke", ["za kg"], (1.5, 3.0)),
+    ("Paradižnik", ["za kg", "500 g"], (1.5, 4.0)),
+    ("Krompir", ["2 kg", "5 kg"], (1.5, 5.0)),
+    ("Čebula", ["1 kg", "2 kg"], (0.9, 2.5)),
+    ("Olivno olje", ["0,75 l", "1 l"], (6.0, 14.0)),
+    ("Sončnično olje", ["1 l"], (1.8, 3.5)),
+    ("Testenine", ["500 g"], (0.7, 2.5)),
+    ("Riž", ["1 kg"], (1.2, 3.5)),
+    ("Kava mleta", ["250 g", "500 g"], (3.0, 9.0)),
+    ("Čokolada mlečna", ["100 g", "300 g"], (1.0, 4.5)),
+    ("Pivo Laško", ["0,5 l", "6 x 0,5 l"], (0.9, 6.5)),
+    ("Mineralna voda", ["1,5 l", "6 x 1,5 l"], (0.5, 4.0)),
+    ("Pomarančni sok", ["1 l"], (1.2, 2.8)),
+    ("Detergent za perilo", ["2 l", "4,5 kg"], (6.0, 20.0)),
+    ("Toaletni papir", ["10 rol", "24 rol"], (3.0, 12.0)),
+    ("Zobna pasta", ["75 ml"], (1.5, 4.0)),
+]
+ADJECTIVES = ["", "", "", "Bio ", "Domači ", "Sveži ", "Premium ", "Slovenski "]
+
+# Share of offers per store, roughly following their catalog sizes
+STORE_WEIGHTS = {"Lidl": 0.28, "Hofer": 0.24, "Spar": 0.2, "Mercator": 0.18, "Eurospin": 0.1}
+OFFER_LENGTHS = [3, 7, 7, 14, 14, 21]
+
+BATCH_SIZE = 10_000
+WORKERS = 4
+
+def _discount_id(seed, index, reference_date):
+    """Deterministic ObjectId for the discount at `index`.
+
+    Cart rows can reference discounts without reading them back, and the
+    embedded timestamp stays realistic for ObjectId-based watermarks.
+    """
+    timestamp = int(reference_date.timestamp()) - 86_400 + index // 1000
+    return ObjectId(struct.pack(">III", timestamp, seed & 0xFFFFFFFF, index))
+
+def _make_discount(rng, seed, index, reference_date, stores, store_weights):
+    """Build one realistic discount document"""
+    name, quantities, (low, high) = rng.choice(PRODUCTS)
+    normal_price = rng.uniform(low, high)
+    has_discount = rng.random() < 0.7
+    discount_percentage = rng.choice([10, 15, 20, 25, 30, 35, 40, 50]) if has_discount else None
+    discount_price = normal_price * (1 - (discount_percentage or 0) / 100)
     
-    # Sample stores
-    stores = ["Lidl", "Hofer", "Spar", "Mercator", "Eurospin"]
+    # Offers start up to two weeks back, so windows overlap across catalogs
+    start_date = reference_date - timedelta(days=rng.randint(0, 14))
+    end_date = start_date + timedelta(days=rng.choice(OFFER_LENGTHS))
     
-    # Create dummy discounts
-    discounts = []
-    for i in range(50):  # Create 50 dummy discounts
-        store = stores[i % len(stores)]
-        normal_price = round(10 + (i * 2.5), 2)
-        discount_percentage = 10 + (i % 30)  # Random discount between 10% and 40%
-        discount_price = round(normal_price * (1 - discount_percentage/100), 2)
-        
-        start_date = datetime.utcnow() - timedelta(days=i % 7)
-        end_date = start_date + timedelta(days=14)
-        
-        # Create bounding box for the item in the PDF
-        bounding_box = {
-            "x": i * 10,
-            "y": i * 10,
-            "width": 100,
-            "height": 100
-        }
-        
-        discount = {
-            "item_description": f"Product {i+1}",
-            "discount_price": discount_price,
-            "discount_percentage": discount_percentage,
-            "store": store,
-            "offer_start_date": start_date,
-            "offer_end_date": end_date,
-            "trending_score": 0,
-            "quantity": i % 10 + 1,  # Random quantity between 1 and 10
-            "bounding_box": bounding_box
+    return {
+        "_id": _discount_id(seed, index, reference_date),
+        "item_description": f"{rng.choice(ADJECTIVES)}{name}",
+        "discount_price": round(discount_price, 2),
+        "discount_percentage": float(discount_percentage) if discount_percentage else None,
+        "store": rng.choices(stores, weights=store_weights)[0],
+        "offer_start_date": start_date,
+        "offer_end_date": end_date,
+        # Heavy-tailed: most offers are never looked at, a few are very hot
+        "trending_score": min(int(rng.paretovariate(1.2)) - 1, 10_000),
+        "quantity": rng.choice(quantities),
+        "bounding_box": {
+            "x": rng.randint(0, 4000),
+            "y": rng.randint(0, 6000),
+            "width": rng.randint(800, 2000),
+            "height": rng.randint(800, 3000)
         }
-        discounts.append(discount)
+    }
+
+def _make_cart_item(rng, seed, index, reference_date, num_users, num_discounts):
+    """Build one shopping cart row pointing at a generated discount"""
+    # Popular discounts end up in many carts
+    rank = min(int(rng.paretovariate(0.8)) - 1, num_discounts - 1)
+    discount_index = (rank * 7919) % num_discounts
+    return {
+        "user_id": f"user_{rng.randrange(num_users)}",
+        "discount_id": str(_discount_id(seed, discount_index, reference_date)),
+        "added_date": reference_date - timedelta(minutes=rng.randint(0, 60 * 24 * 14))
+    }
+
+def _make_notification(rng, seed, index, reference_date, num_users, num_discounts):
+    """Build one notification registration"""
+    return {
+        "user_id": f"user_{index % num_users}",
+        "device_id": f"device_{index}",
+        "updated_at": reference_date
+    }
+
+def _generate_batch(make_document, collection_name, seed, start, stop, args):
+    """Documents `start` to `stop`; runs in a worker process.
+
+    Each batch gets its own RNG derived from the seed and the batch number,
+    so the data is identical however many workers run.
+    """
+    rng = random.Random(f"{seed}:{collection_name}:{start}")
+    return [make_document(rng, seed, index, *args) for index in range(start, stop)]
+
+async def _insert_generated(pool, collection, make_document, count, seed, batch_size, workers, *args):
+    """Generate `count` documents in `pool` and insert them in unordered batches.
+
+    Generation is CPU-bound, so batches are built in worker processes while
+    the event loop inserts the batches that are ready.
+    """
+    loop = asyncio.get_running_loop()
+    batches = asyncio.Queue()
+    for start in range(0, count, batch_size):
+        batches.put_nowait(start)
     
-    # Insert discounts
-    if discounts:
-        await db.discounts.insert_many(discounts)
-        print(f"Inserted {len(discounts)} dummy discounts")
+    async def worker():
+        while True:
+            try:
+                start = batches.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            documents = await loop.run_in_executor(
+                pool, _generate_batch, make_document, collection.name, seed,
+                start, min(start + batch_size, count), args
+            )
+            await collection.insert_many(documents, ordered=False)
     
-    # Create some dummy shopping cart items
-    shopping_cart_items = []
-    for i in range(20):  # Create 20 dummy shopping cart items
-        user_id = f"user_{i % 5}"  # 5 different users
-        # Get a random discount ID from the inserted discounts
-        discount = discounts[i % len(discounts)]
-        discount_id = str(discount["_id"]) if "_id" in discount else str(ObjectId())
-        
-        item = {
-            "user_id": user_id,
-            "discount_id": discount_id,
-            "added_date": datetime.utcnow() - timedelta(days=i % 3)
-        }
-        shopping_cart_items.append(item)
+    await asyncio.gather(*(worker() for _ in range(min(workers, max(1, batches.qsize())))))
+    print(f"Inserted {count} generated {collection.name}")
+
+async def init_database(num_discounts=50, num_cart_items=20, num_notifications=10,
+                        num_users=None, seed=42, reference_date=None,
+                        batch_size=BATCH_SIZE, workers=WORKERS):
+    """Initialize the database with reproducible generated data.
+
+    The defaults give the small dummy dataset used in development; pass
+    millions of discounts for load testing. The same seed and reference
+    date always produce the same documents.
+    """
+    # Clear existing data
+    await clear_database()
     
-    # Insert shopping cart items
-    if shopping_cart_items:
-        await db.shopping_cart.insert_many(shopping_cart_items)
-        print(f"Inserted {len(shopping_cart_items)} dummy shopping cart items")
+    if reference_date is None:
+        reference_date = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    if num_users is None:
+        num_users = max(5, num_notifications)
     
-    # Create some dummy notifications
-    notifications = []
-    for i in range(10):  # Create 10 dummy notifications
-        user_id = f"user_{i % 5}"  # 5 different users
-        
-        notification = {
-            "user_id": user_id,
-            "device_id": f"device_{i}"
-        }
-        notifications.append(notification)
+    stores = list(STORE_WEIGHTS)
+    store_weights = list(STORE_WEIGHTS.values())
     
-    # Insert notifications
-    if notifications:
-        await db.notifications.insert_many(notifications)
-        print(f"Inserted {len(notifications)} dummy notifications")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        await _insert_generated(
+            pool, db.discounts, _make_discount, num_discounts, seed, batch_size, workers,
+            reference_date, stores, store_weights
+        )
+        if num_discounts:
+            await _insert_generated(
+                pool, db.shopping_cart, _make_cart_item, num_cart_items, seed, batch_size, workers,
+                reference_date, num_users, num_discounts
+            )
+        await _insert_generated(
+            pool, db.notifications, _make_notification, num_notifications, seed, batch_size, workers,
+            reference_date, num_users, num_discounts
+        )
     
-    print("Database initialized with dummy data successfully")
+    await bump_data_version(db)
+    print("Database initialized with generated data successfully")
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Fill the database with generated data")
+    parser.add_argument("--discounts", type=int, default=50)
+    parser.add_argument("--cart-items", type=int, default=20)
+    parser.add_argument("--notifications", type=int, default=10)
+    parser.add_argument("--users", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reference-date", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+    
     # Run the initialization
-    asyncio.run(init_database()) 
\ No newline at end of file
+    asyncio.run(init_database(
+        num_discounts=args.discounts,
+        num_cart_items=args.cart_items,
+        num_notifications=args.notifications,
+        num_users=args.users,
+        seed=args.seed,
+        reference_date=args.reference_date,
+        batch_size=args.batch_size,
+        workers=args.workers
+    ))
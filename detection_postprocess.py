@@ -0,0 +1,192 @@
+"""Vectorized post-processing of a page's model detections.
+
+All boxes of a page go into one NumPy array and are clipped to Gemini's
+0-1000 space, put in min/max order and scaled to pixels together. A box
+overlapping a better one by more than ``IOU_THRESHOLD`` is one of the
+duplicates Gemini often emits for a single product: it is merged into the
+kept box (union of the boxes, empty text fields filled in) instead of
+becoming a second crop and a second ``discounts`` row.
+
+Validity dates are parsed by ``OfferDateParser`` with precompiled patterns
+and memoized per catalog, since a catalog repeats the same few strings.
+"""
+import re
+from collections import defaultdict
+
+import numpy as np
+
+BOX_KEYS = ("ymin", "xmin", "ymax", "xmax")
+# Detection key -> (product key, value when missing)
+TEXT_FIELDS = {
+    "label": ("name", "Unknown Product"),
+    "price": ("price", "Unknown Price"),
+    "quantity": ("quantity", ""),
+    "description": ("description", ""),
+    "discount": ("discount", ""),
+    "validity_date": ("validity_date", ""),
+}
+IOU_THRESHOLD = 0.7
+
+_DATE_RANGE = re.compile(r'(\d{1,2})\.(\d{1,2})?.?-(\d{1,2})\.(\d{1,2})?(?:\.(\d{4}))?')
+_SINGLE_DATE = re.compile(r'(\d{1,2})\.(\d{1,2})?(?:\.(\d{4}))?')
+
+
+def box_array(detections):
+    """Indices and (ymin, xmin, ymax, xmax) rows of detections with numeric boxes"""
+    indices, rows = [], []
+    for i, detection in enumerate(detections):
+        try:
+            rows.append([float(detection[key]) for key in BOX_KEYS])
+        except (KeyError, TypeError, ValueError):
+            continue
+        indices.append(i)
+    return np.array(indices, dtype=np.intp), np.array(rows, dtype=np.float64).reshape(-1, 4)
+
+
+def scale_boxes(boxes, width, height):
+    """0-1000 (ymin, xmin, ymax, xmax) rows to pixel (x1, y1, x2, y2) rows"""
+    boxes = np.clip(boxes, 0, 1000)
+    ys = np.sort(boxes[:, [0, 2]], axis=1)
+    xs = np.sort(boxes[:, [1, 3]], axis=1)
+    pixels = np.column_stack([xs[:, 0], ys[:, 0], xs[:, 1], ys[:, 1]])
+    # Truncated like the int() of the per-detection code it replaces
+    return (pixels * (np.array([width, height, width, height]) / 1000)).astype(np.int64)
+
+
+def pair_iou(a, b):
+    """IoU of corresponding rows of two (x1, y1, x2, y2) arrays"""
+    width = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    height = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    intersection = width * height
+    union = ((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+             + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - intersection)
+    return intersection / np.maximum(union, 1)
+
+
+def duplicate_pairs(boxes, iou_threshold=IOU_THRESHOLD):
+    """Index pairs of boxes overlapping by more than the threshold.
+
+    IoU above t needs a horizontal overlap of at least t times each width,
+    so after sorting on x1 only the boxes starting within (1 - t) * width
+    of a box are candidates; no full N x N matrix is built.
+    """
+    order = np.argsort(boxes[:, 0], kind="stable")
+    ordered = boxes[order].astype(np.float64)
+    reach = ordered[:, 0] + (1 - iou_threshold) * (ordered[:, 2] - ordered[:, 0])
+    counts = np.searchsorted(ordered[:, 0], reach, side="right") - np.arange(len(ordered)) - 1
+    counts = np.maximum(counts, 0)
+    first = np.repeat(np.arange(len(ordered)), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    duplicate = pair_iou(ordered[first], ordered[second]) > iou_threshold
+    return order[first[duplicate]], order[second[duplicate]]
+
+
+def suppress_duplicates(first, second, scores):
+    """Greedy non-maximum suppression over duplicate pairs.
+
+    `scores` maps every index in the pairs to its score; returns
+    {kept index: [duplicate indices]} for the boxes involved.
+    """
+    neighbours = defaultdict(list)
+    for a, b in zip(first.tolist(), second.tolist()):
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+    taken = set()
+    groups = {}
+    for index in sorted(neighbours, key=scores.__getitem__, reverse=True):
+        if index in taken:
+            continue
+        taken.add(index)
+        duplicates = [n for n in neighbours[index] if n not in taken]
+        taken.update(duplicates)
+        groups[index] = duplicates
+    return groups
+
+
+def _score(detection, box):
+    """Prefer the detection that read the most fields, then the larger box"""
+    filled = sum(1 for key in TEXT_FIELDS if detection.get(key))
+    return filled, (box[2] - box[0]) * (box[3] - box[1])
+
+
+def postprocess(detections, width, height, iou_threshold=IOU_THRESHOLD):
+    """Products in CatalogProcessor's format and counts of dropped detections"""
+    indices, boxes = box_array(detections)
+    pixels = scale_boxes(boxes, width, height)
+    valid = (pixels[:, 2] > pixels[:, 0]) & (pixels[:, 3] > pixels[:, 1])
+    indices, pixels = indices[valid].tolist(), pixels[valid]
+    stats = {"invalid": len(detections) - len(indices), "suppressed": 0}
+    if not indices:
+        return [], stats
+
+    rows = pixels.tolist()
+    groups = {i: () for i in range(len(indices))}
+    first, second = duplicate_pairs(pixels, iou_threshold)
+    if len(first):
+        involved = set(first.tolist()) | set(second.tolist())
+        scores = {i: _score(detections[indices[i]], rows[i]) for i in involved}
+        for keep, duplicates in suppress_duplicates(first, second, scores).items():
+            for duplicate in duplicates:
+                del groups[duplicate]
+            groups[keep] = duplicates
+            stats["suppressed"] += len(duplicates)
+
+    products = []
+    # Keep the page's reading order rather than the score order
+    for keep in sorted(groups):
+        duplicates = groups[keep]
+        detection = detections[indices[keep]]
+        if not duplicates:
+            product = {"bbox": rows[keep]}
+            for key, (field, default) in TEXT_FIELDS.items():
+                product[field] = detection.get(key) or default
+            products.append(product)
+            continue
+
+        # Union of the duplicates, text from the best one with gaps filled
+        members = [keep] + duplicates
+        product = {"bbox": [min(rows[m][0] for m in members), min(rows[m][1] for m in members),
+                            max(rows[m][2] for m in members), max(rows[m][3] for m in members)]}
+        for key, (field, default) in TEXT_FIELDS.items():
+            values = (detections[indices[m]].get(key) for m in members)
+            product[field] = next((value for value in values if value), None) or default
+        products.append(product)
+    return products, stats
+
+
+class OfferDateParser:
+    """Validity text such as "10.4.-16.4." to (start, end) ISO dates, memoized"""
+
+    def __init__(self, default_start=None, default_end=None, year="2025", month="4"):
+        self.default_start = default_start
+        self.default_end = default_end
+        self.year = year
+        self.month = month
+        self._memo = {}
+
+    def parse(self, validity_date):
+        if not validity_date:
+            return self.default_start, self.default_end
+        try:
+            return self._memo[validity_date]
+        except KeyError:
+            result = self._memo[validity_date] = self._parse(validity_date)
+            return result
+
+    def _parse(self, validity_date):
+        match = _DATE_RANGE.search(validity_date)
+        if match:
+            start_day, start_month, end_day, end_month, year = match.groups()
+            year = year or self.year
+            # "10.-16.4." gives the month only once
+            start_month = start_month or end_month or self.month
+            end_month = end_month or start_month
+            return (f"{year}-{int(start_month):02d}-{int(start_day):02d}",
+                    f"{year}-{int(end_month):02d}-{int(end_day):02d}")
+
+        match = _SINGLE_DATE.search(validity_date)
+        if match:
+            day, month, year = match.groups()
+            date = f"{year or self.year}-{int(month or self.month):02d}-{int(day):02d}"
+            return date, date
+        return self.default_start, self.default_end
@@ -1,9 +1,10 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson import ObjectId
 import os
 from dotenv import load_dotenv
+from backup_format import BackupWriter, file_extension
 
 # Load environment variables
 load_dotenv()
@@ -13,48 +14,104 @@ MONGODB_URL = "connection_url_string"
 client = AsyncIOMotorClient(MONGODB_URL)
 db = client.discount_hunter
 
-class JSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+MANIFEST_DIR = 'backups/manifests'
+TOMBSTONE_COLLECTION = 'backup_tombstones'
 
-async def export_collection(collection_name):
-    """Export a collection to a JSON file"""
+# Collections whose documents are modified in place carry an `updated_at`
+# field maintained by their writers. Everything else is insert-only, so the
+# ObjectId timestamp alone is enough to find new documents. Archived offers
+# keep the _id they had in `discounts`, so the archive counts as modified.
+UPDATED_AT_COLLECTIONS = {'notifications', 'product_images', 'discounts_archive'}
+
+# Watermarks are moved back by this much so that documents written by a
+# client with a slightly skewed clock are exported again rather than lost.
+# Re-exported documents are upserted on restore, so the overlap is harmless.
+CLOCK_SKEW = timedelta(minutes=1)
+
+async def export_collection(collection_name, query=None, suffix='', fmt='json'):
+    """Export a collection (or the documents matching `query`) to a backup file"""
     collection = db[collection_name]
-    documents = await collection.find().to_list(length=None)
-    
-    # Convert ObjectId to string for JSON serialization
-    for doc in documents:
-        if '_id' in doc:
-            doc['_id'] = str(doc['_id'])
-        if 'bounding_box' in doc and doc['bounding_box']:
-            doc['bounding_box'] = dict(doc['bounding_box'])
     
     # Create backup directory if it doesn't exist
     os.makedirs('backups', exist_ok=True)
     
     # Save to file with timestamp
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'backups/{collection_name}_{timestamp}.json'
+    filename = f'backups/{collection_name}_{timestamp}{suffix}{file_extension(fmt)}'
     
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(documents, f, ensure_ascii=False, indent=2, cls=JSONEncoder)
+    # Stream documents straight from the cursor into the file
+    with BackupWriter(filename, fmt) as writer:
+        async for doc in collection.find(query or {}):
+            writer.write(doc)
     
-    print(f"Exported {len(documents)} documents from {collection_name} to {filename}")
+    print(f"Exported {writer.count} documents from {collection_name} to {filename}")
+    return filename, writer.count
+
+async def _backup_collection_names():
+    """List the collections that take part in a backup"""
+    collections = await db.list_collection_names()
+    return [
+        c for c in collections
+        if c not in ['system.indexes', 'system.profile', TOMBSTONE_COLLECTION]
+    ]
+
+def _next_watermark(collection_name, started_at, previous=None):
+    """Compute the watermark a backup taken at `started_at` leaves behind"""
+    cutoff = started_at - CLOCK_SKEW
+    watermark = {'_id': str(ObjectId.from_datetime(cutoff))}
+    if collection_name in UPDATED_AT_COLLECTIONS:
+        watermark['updated_at'] = cutoff.isoformat()
+    if previous:
+        # Never move a watermark backwards
+        if previous.get('_id') and ObjectId(previous['_id']) > ObjectId(watermark['_id']):
+            watermark['_id'] = previous['_id']
+        if previous.get('updated_at') and previous['updated_at'] > watermark.get('updated_at', ''):
+            watermark['updated_at'] = previous['updated_at']
+    return watermark
+
+def _changes_query(watermark):
+    """Build the query selecting documents changed after `watermark`"""
+    clauses = [{'_id': {'$gt': ObjectId(watermark['_id'])}}]
+    if watermark.get('updated_at'):
+        clauses.append({'updated_at': {'$gt': datetime.fromisoformat(watermark['updated_at'])}})
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+def _write_manifest(manifest):
+    """Persist a manifest into the chain and return its filename"""
+    os.makedirs(MANIFEST_DIR, exist_ok=True)
+    filename = f"{MANIFEST_DIR}/{manifest['id']}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
     return filename
 
-async def export_all_collections():
+def load_manifests(manifest_dir=MANIFEST_DIR):
+    """Load every manifest in the chain, oldest first"""
+    if not os.path.exists(manifest_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(manifest_dir)):
+        if name.endswith('.json'):
+            with open(os.path.join(manifest_dir, name), 'r', encoding='utf-8') as f:
+                manifests.append(json.load(f))
+    manifests.sort(key=lambda m: m['timestamp'])
+    return manifests
+
+async def export_all_collections(fmt='json'):
     """Export all collections in the database"""
-    collections = await db.list_collection_names()
+    started_at = datetime.utcnow()
+    collections = await _backup_collection_names()
     backup_files = {}
+    manifest_collections = {}
     
     for collection in collections:
-        if collection not in ['system.indexes', 'system.profile']:
-            filename = await export_collection(collection)
-            backup_files[collection] = filename
+        filename, count = await export_collection(collection, fmt=fmt)
+        backup_files[collection] = filename
+        manifest_collections[collection] = {
+            'file': filename,
+            'count': count,
+            'tombstones': [],
+            'watermark': _next_watermark(collection, started_at),
+        }
     
     # Save backup metadata
     metadata = {
@@ -65,9 +122,83 @@ async def export_all_collections():
     with open('backups/backup_metadata.json', 'w', encoding='utf-8') as f:
         json.dump(metadata, f, ensure_ascii=False, indent=2)
     
+    # A full export starts a new chain of manifests
+    _write_manifest({
+        'id': f"{started_at.strftime('%Y%m%d_%H%M%S')}_full",
+        'type': 'full',
+        'parent': None,
+        'timestamp': started_at.isoformat(),
+        'collections': manifest_collections,
+    })
+    
     print("\nBackup completed successfully!")
     return metadata
 
+async def export_incremental(fmt='json'):
+    """Export only the documents changed since the last backup in the chain.
+
+    Falls back to a full export when there is no chain to extend yet.
+    """
+    manifests = load_manifests()
+    if not manifests:
+        print("No previous backup found, taking a full backup")
+        return await export_all_collections(fmt)
+    
+    parent = manifests[-1]
+    parent_started_at = datetime.fromisoformat(parent['timestamp'])
+    started_at = datetime.utcnow()
+    manifest_collections = {}
+    
+    for collection in await _backup_collection_names():
+        previous = parent['collections'].get(collection, {}).get('watermark')
+        if previous and collection in UPDATED_AT_COLLECTIONS and not previous.get('updated_at'):
+            # The chain was started before this collection tracked updated_at
+            previous = {**previous, 'updated_at': (parent_started_at - CLOCK_SKEW).isoformat()}
+        if previous:
+            filename, count = await export_collection(
+                collection, query=_changes_query(previous), suffix='_incr', fmt=fmt
+            )
+        else:
+            # Collection appeared after the last backup
+            filename, count = await export_collection(collection, suffix='_incr', fmt=fmt)
+        
+        tombstones = await db[TOMBSTONE_COLLECTION].find(
+            {
+                'collection': collection,
+                'deleted_at': {'$gt': parent_started_at - CLOCK_SKEW},
+            },
+            {'doc_id': 1},
+        ).to_list(length=None)
+        
+        manifest_collections[collection] = {
+            'file': filename,
+            'count': count,
+            'tombstones': [str(t['doc_id']) for t in tombstones],
+            'watermark': _next_watermark(collection, started_at, previous),
+        }
+    
+    _write_manifest({
+        'id': f"{started_at.strftime('%Y%m%d_%H%M%S')}_incr",
+        'type': 'incremental',
+        'parent': parent['id'],
+        'timestamp': started_at.isoformat(),
+        'collections': manifest_collections,
+    })
+    
+    # Tombstones older than the new chain head are no longer needed
+    await db[TOMBSTONE_COLLECTION].delete_many(
+        {'deleted_at': {'$lte': parent_started_at - CLOCK_SKEW}}
+    )
+    
+    print("\nIncremental backup completed successfully!")
+    return manifest_collections
+
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(export_all_collections()) 
\ No newline at end of file
+    import sys
+    # e.g. python export_db.py --incremental --format bson
+    fmt = sys.argv[sys.argv.index('--format') + 1] if '--format' in sys.argv else 'json'
+    if '--incremental' in sys.argv:
+        asyncio.run(export_incremental(fmt))
+    else:
+        asyncio.run(export_all_collections(fmt))
@@ -0,0 +1,102 @@
+"""Deterministic stand-in for ``genai.Client`` used by offline benchmarks.
+
+It only implements what CatalogProcessor calls,
+``client.models.generate_content(model=..., contents=...)``. Each call
+sleeps for the configured latency and returns a fenced JSON array of
+detections laid out on the same grid as benchmarks/fixture_pdfs.py, so crops
+and summaries line up with the rendered fixture pages.
+
+Failures, malformed answers and slow tail calls can be injected at given
+rates to exercise ResilientModelClient.
+"""
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+PRODUCT_NAMES = [
+    "Banane", "Mleko", "Jogurt", "Sir Edamec", "Maslo", "Jajca", "Svinjski file",
+    "Piščančje prsi", "Pršut", "Orehova potica", "Kruh", "Bučke", "Paradižnik",
+    "Krompir", "Olivno olje", "Testenine", "Kava", "Čokolada",
+]
+QUANTITIES = ["za kg", "1 kg", "400 g", "1 l", "500 g", "10 kos"]
+
+GRID_ROWS = 4
+GRID_COLS = 3
+
+
+def grid_boxes(rows=GRID_ROWS, cols=GRID_COLS, margin=20):
+    """Product boxes as (ymin, xmin, ymax, xmax) in Gemini's 0-1000 space"""
+    boxes = []
+    cell_h = 1000 / rows
+    cell_w = 1000 / cols
+    for r in range(rows):
+        for c in range(cols):
+            boxes.append((
+                int(r * cell_h + margin), int(c * cell_w + margin),
+                int((r + 1) * cell_h - margin), int((c + 1) * cell_w - margin),
+            ))
+    return boxes
+
+
+class FakeModelClient:
+    def __init__(self, latency=0.0, rows=GRID_ROWS, cols=GRID_COLS, seed=0,
+                 validity_date="10.4.-16.4.", failure_rate=0.0, malformed_rate=0.0,
+                 slow_rate=0.0, slow_latency=10.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.rows = rows
+        self.cols = cols
+        self.seed = seed
+        self.validity_date = validity_date
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+
+    def detections(self, call_index):
+        """The canned detections returned for the `call_index`-th call"""
+        rng = random.Random(self.seed * 1_000_003 + call_index)
+        detections = []
+        for ymin, xmin, ymax, xmax in grid_boxes(self.rows, self.cols):
+            discount = rng.choice(["", "-20%", "-30%", "25% off"])
+            detections.append({
+                "ymin": ymin, "xmin": xmin, "ymax": ymax, "xmax": xmax,
+                "label": rng.choice(PRODUCT_NAMES),
+                "price": f"{rng.uniform(0.5, 15):.2f}",
+                "quantity": rng.choice(QUANTITIES),
+                "description": "",
+                "discount": discount,
+                "validity_date": self.validity_date,
+                "offer_end": "",
+            })
+        return detections
+
+    def generate_content(self, model, contents):
+        with self._lock:
+            call_index = self.calls
+            self.calls += 1
+        rng = random.Random(-self.seed * 1_000_003 - call_index - 1)
+        latency = self.slow_latency if rng.random() < self.slow_rate else self.latency
+        if latency:
+            time.sleep(latency)
+        if rng.random() < self.failure_rate:
+            raise RuntimeError("503 model overloaded (simulated)")
+        text = "```json\n" + json.dumps(self.detections(call_index), ensure_ascii=False) + "\n```"
+        if rng.random() < self.malformed_rate:
+            # Cut off mid-answer like a truncated generation
+            text = text[:len(text) // 2]
+        return SimpleNamespace(
+            text=text,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=1290,
+                candidates_token_count=len(text) // 4,
+                total_token_count=1290 + len(text) // 4,
+            ),
+        )
+
+    def close(self):
+        pass
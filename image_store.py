@@ -0,0 +1,256 @@
+"""Content-addressed store for product crops, deduplicated by perceptual hash.
+
+Weekly catalogs reuse the same product photos, so most crops are near
+copies of one already stored. Each crop is keyed by its 64-bit difference
+hash (dHash). A crop within ``threshold`` bits of a stored one with the
+same shape is not encoded or written again: the existing ``image_id`` is
+returned and its reference count goes up. A dHash only sees the coarse
+grayscale layout, so a match must also agree with a small colour
+fingerprint; otherwise every tile of one catalog template would collapse
+into one image.
+
+Crops include the product's name and price, which neither the hash nor the
+fingerprint can resolve: the same photo next week at a new price looks
+identical to them. Every crop therefore carries a ``label`` built from the
+text read off it, and only crops with the same label are merged.
+
+Candidates are found through a multikey index on the hash split into
+``BANDS`` 16-bit bands. Two hashes differing in at most ``BANDS - 1`` bits
+share at least one band exactly, so the lookup misses nothing within the
+threshold. The ``image_id`` is the hash plus a digest of the fingerprint and
+label, and files live in a sharded tree, ``IMAGE_STORE_DIR/ab/cd/abcd....png``.
+
+Discounts hold references: ``refs`` goes down when a discount is archived
+or discarded by a retried ingest job, and ``collect`` removes the records
+and files nobody has referenced for a while.
+
+    python image_store.py stats   # unique images, references and reuse rate
+    python image_store.py gc      # delete unreferenced images
+"""
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+IMAGE_COLLECTION = "product_images"
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "image_store")
+
+BANDS = 4
+DEFAULT_THRESHOLD = BANDS - 1
+# Crops whose width/height ratios differ by more than this are never merged
+MAX_ASPECT_DIFFERENCE = 0.1
+# Allowed 90th percentile of the per-pixel difference (0-255) between two
+# 16x16 fingerprints. Re-encoded or slightly shifted crops stay below 5,
+# different products on the same template start around 70.
+MAX_FINGERPRINT_DIFFERENCE = 24
+# Unreferenced images untouched for this long are deleted by collect(); the
+# delay lets a crop that is about to be reused keep its file
+COLLECT_GRACE = timedelta(hours=1)
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash: is each pixel brighter than its left neighbour"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def fingerprint(image, size=16):
+    """Downscaled RGB pixels as hex, compared after a hash match"""
+    return image.convert("RGB").resize((size, size), Image.BILINEAR).tobytes().hex()
+
+
+def fingerprint_difference(a, b):
+    a, b = bytes.fromhex(a), bytes.fromhex(b)
+    a = np.frombuffer(a, np.uint8).reshape(-1, 3).astype(np.int16)
+    b = np.frombuffer(b, np.uint8).reshape(-1, 3).astype(np.int16)
+    return float(np.percentile(np.abs(a - b).max(axis=1), 90))
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def hash_bands(hash_hex):
+    """Index keys for the bands of a 16 hex digit hash"""
+    width = len(hash_hex) // BANDS
+    return [f"{i}:{hash_hex[i * width:(i + 1) * width]}" for i in range(BANDS)]
+
+
+def make_label(*texts):
+    """Text shown on a crop, e.g. its name and price, in comparable form"""
+    return "|".join(" ".join(str(text or "").lower().split()) for text in texts)
+
+
+def make_image_id(hash_hex, print_hex, label=""):
+    """The hash alone is not unique: different crops of one template share it"""
+    digest = hashlib.blake2b(f"{print_hex}|{label}".encode(), digest_size=4)
+    return hash_hex + digest.hexdigest()
+
+
+def release_operations(image_ids, now=None):
+    """Bulk updates dropping one reference per id, for sync or async collections"""
+    now = now or datetime.utcnow()
+    counts = Counter(image_id for image_id in image_ids if image_id)
+    return [UpdateOne({"image_id": image_id}, {"$inc": {"refs": -count}, "$set": {"updated_at": now}})
+            for image_id, count in counts.items()]
+
+
+def image_path(image_id, root=IMAGE_STORE_DIR):
+    return os.path.join(root, image_id[:2], image_id[2:4], f"{image_id}.png")
+
+
+class ImageStore:
+    def __init__(self, db, root=IMAGE_STORE_DIR, threshold=DEFAULT_THRESHOLD):
+        if threshold >= BANDS:
+            raise ValueError(f"threshold must be below {BANDS} for the band lookup to find every match")
+        self.images = db[IMAGE_COLLECTION]
+        self.root = root
+        self.threshold = threshold
+
+    def ensure_indexes(self):
+        self.images.create_index("image_id", unique=True)
+        self.images.create_index([("label", 1), ("bands", 1)])
+        self.images.create_index("updated_at")
+        self.images.create_index([("refs", 1), ("updated_at", 1)])
+
+    def find_similar(self, hash_value, aspect, print_hex, label=""):
+        """The closest stored image with the same label within the threshold, or None"""
+        best, best_distance = None, self.threshold + 1
+        candidates = self.images.find({"label": label, "bands": {"$in": hash_bands(f"{hash_value:016x}")}})
+        for candidate in candidates:
+            if abs(candidate["aspect"] - aspect) > MAX_ASPECT_DIFFERENCE * aspect:
+                continue
+            distance = hamming(hash_value, int(candidate["dhash"], 16))
+            if distance >= best_distance:
+                continue
+            if fingerprint_difference(print_hex, candidate["fingerprint"]) > MAX_FINGERPRINT_DIFFERENCE:
+                continue
+            best, best_distance = candidate, distance
+        return best
+
+    def put(self, image, label=""):
+        """Store `image` unless a near copy with the same label exists; returns (image_id, reused)"""
+        hash_value = dhash(image)
+        aspect = image.width / image.height
+        print_hex = fingerprint(image)
+        now = datetime.utcnow()
+
+        existing = self.find_similar(hash_value, aspect, print_hex, label)
+        # The match may have been collected since it was found
+        if existing is not None and self._add_reference(existing["image_id"], now):
+            return existing["image_id"], True
+
+        hash_hex = f"{hash_value:016x}"
+        image_id = make_image_id(hash_hex, print_hex, label)
+        path = image_path(image_id, self.root)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format="PNG")
+        os.replace(tmp_path, path)
+
+        try:
+            self.images.insert_one({
+                "image_id": image_id,
+                "dhash": hash_hex,
+                "bands": hash_bands(hash_hex),
+                "aspect": aspect,
+                # Hex rather than bytes, so JSON backups can export it
+                "fingerprint": print_hex,
+                "label": label,
+                "width": image.width,
+                "height": image.height,
+                "bytes": os.path.getsize(path),
+                "refs": 1,
+                "created_at": now,
+                "updated_at": now,
+            })
+        except DuplicateKeyError:
+            # Another worker stored the same picture first
+            self._add_reference(image_id, now)
+            return image_id, True
+        return image_id, False
+
+    def _add_reference(self, image_id, now):
+        return self.images.update_one(
+            {"image_id": image_id}, {"$inc": {"refs": 1}, "$set": {"updated_at": now}}
+        ).matched_count == 1
+
+    def release(self, image_ids):
+        """Drop one reference for each id, e.g. of deleted discounts"""
+        operations = release_operations(image_ids)
+        if operations:
+            self.images.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    def collect(self, grace=COLLECT_GRACE):
+        """Delete images without references untouched for `grace`; returns (images, bytes)"""
+        cutoff = datetime.utcnow() - grace
+        removed = freed = 0
+        for doc in list(self.images.find({"refs": {"$lte": 0}, "updated_at": {"$lt": cutoff}},
+                                         {"image_id": 1, "bytes": 1})):
+            # Conditional, so an image reused in the meantime is kept
+            if not self.images.delete_one({"_id": doc["_id"], "refs": {"$lte": 0}}).deleted_count:
+                continue
+            removed += 1
+            freed += doc.get("bytes", 0)
+            # A worker may have stored the same picture again since
+            if self.images.find_one({"image_id": doc["image_id"]}, {"_id": 1}) is None:
+                try:
+                    os.remove(image_path(doc["image_id"], self.root))
+                except FileNotFoundError:
+                    pass
+        return removed, freed
+
+    def stats(self):
+        result = list(self.images.aggregate([{"$group": {
+            "_id": None,
+            "images": {"$sum": 1},
+            "references": {"$sum": "$refs"},
+            "bytes_stored": {"$sum": "$bytes"},
+            "bytes_referenced": {"$sum": {"$multiply": ["$bytes", "$refs"]}},
+        }}]))
+        totals = result[0] if result else {"images": 0, "references": 0, "bytes_stored": 0, "bytes_referenced": 0}
+        totals.pop("_id", None)
+        references = totals["references"]
+        totals["reuse_rate"] = round(1 - totals["images"] / references, 4) if references else 0.0
+        totals["bytes_saved"] = totals["bytes_referenced"] - totals["bytes_stored"]
+        return totals
+
+
+def main():
+    import argparse
+    import json
+
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Deduplicated product image store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="show stored images, references and reuse rate")
+    commands.add_parser("init", help="create the collection indexes")
+    commands.add_parser("gc", help="delete images no discount references any more")
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGODB_URL", "connection_url_string"))
+    store = ImageStore(client.discount_hunter)
+    if args.command == "init":
+        store.ensure_indexes()
+        print(f"Indexes created on {IMAGE_COLLECTION}")
+    elif args.command == "gc":
+        removed, freed = store.collect()
+        print(f"Removed {removed} unreferenced images, freed {freed} bytes")
+    else:
+        print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""MongoDB-backed queue of catalog ingestion jobs.
+
+Workers claim jobs atomically with ``find_one_and_update``, so any number
+of worker processes on any number of machines can drain the queue without
+coordination. A claimed job holds a lease that its worker extends with
+heartbeats. If a worker dies, the lease runs out and another worker
+reclaims the job. Failed jobs are retried with exponential backoff until
+they run out of attempts.
+"""
+import socket
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+JOB_COLLECTION = "ingest_jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class LeaseLost(Exception):
+    """Raised inside a job that another worker has reclaimed; its writes must stop"""
+
+
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class IngestQueue:
+    def __init__(self, db, lease_seconds=300, max_attempts=3, retry_backoff_seconds=60):
+        self.jobs = db[JOB_COLLECTION]
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.retry_backoff = timedelta(seconds=retry_backoff_seconds)
+
+    def ensure_indexes(self):
+        self.jobs.create_index([
+            ("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)
+        ])
+        self.jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+
+    def enqueue(self, store, pdf_path, offer_start_date=None, offer_end_date=None,
+                priority=0, max_pages=10, max_attempts=None):
+        now = datetime.utcnow()
+        result = self.jobs.insert_one({
+            "store": store,
+            "pdf_path": pdf_path,
+            "offer_start_date": offer_start_date,
+            "offer_end_date": offer_end_date,
+            "max_pages": max_pages,
+            "priority": priority,
+            "status": QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts or self.max_attempts,
+            "not_before": now,
+            "created_at": now,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "error": None,
+        })
+        return result.inserted_id
+
+    def claim(self, worker_id):
+        """Atomically take the most urgent runnable job, or return None.
+
+        Runnable means queued and past its retry backoff, or running under a
+        lease that has expired because its worker stopped heartbeating.
+        """
+        now = datetime.utcnow()
+        return self.jobs.find_one_and_update(
+            {
+                "$or": [
+                    {"status": QUEUED, "not_before": {"$lte": now}},
+                    {"status": RUNNING, "lease_expires_at": {"$lt": now}},
+                ],
+                "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+            },
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker_id": worker_id,
+                    "started_at": now,
+                    "heartbeat_at": now,
+                    "lease_expires_at": now + self.lease,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease; False means the job was reclaimed by someone else"""
+        now = datetime.utcnow()
+        result = self.jobs.update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": RUNNING},
+            {"$set": {"heartbeat_at": now, "lease_expires_at": now + self.lease}},
+        )
+        return result.matched_count == 1
+
+    def complete(self, job_id, worker_id, result=None):
+        return self.jobs.update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": RUNNING},
+            {"$set": {"status": DONE, "finished_at": datetime.utcnow(),
+                      "lease_expires_at": None, "result": result}},
+        ).matched_count == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Requeue the job with backoff, or mark it failed when out of attempts"""
+        job = self.jobs.find_one({"_id": job_id, "worker_id": worker_id, "status": RUNNING})
+        if job is None:
+            return False
+        now = datetime.utcnow()
+        if job["attempts"] >= job["max_attempts"]:
+            update = {"status": FAILED, "finished_at": now}
+        else:
+            backoff = self.retry_backoff * (2 ** (job["attempts"] - 1))
+            update = {"status": QUEUED, "not_before": now + backoff}
+        update.update({"error": error, "lease_expires_at": None})
+        return self.jobs.update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": RUNNING}, {"$set": update}
+        ).matched_count == 1
+
+    def reap_exhausted(self):
+        """Fail jobs whose lease expired on their last allowed attempt"""
+        now = datetime.utcnow()
+        return self.jobs.update_many(
+            {
+                "status": RUNNING,
+                "lease_expires_at": {"$lt": now},
+                "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+            },
+            {"$set": {"status": FAILED, "finished_at": now, "lease_expires_at": None,
+                      "error": "lease expired on final attempt"}},
+        ).modified_count
+
+    def counts(self):
+        return {
+            doc["_id"]: doc["count"]
+            for doc in self.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+        }
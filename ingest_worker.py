@@ -0,0 +1,239 @@
+"""Worker entry point that drains the ingestion job queue.
+
+    python ingest_worker.py enqueue Lidl catalogs/lidl_catalog.pdf --start 2025-04-10 --end 2025-04-20
+    python ingest_worker.py work --processes 4
+    python ingest_worker.py status
+
+Run ``work`` on as many machines as needed; they coordinate through the
+``ingest_jobs`` collection. A job only stores its PDF's path, so every
+worker machine must see the file at that same path (a shared volume such
+as NFS); a worker that cannot find it fails the attempt and the job is
+retried, possibly on another machine.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from pymongo import MongoClient
+
+from ingest_queue import IngestQueue, LeaseLost, make_worker_id
+
+MONGODB_URL = os.getenv("MONGODB_URL", "connection_url_string")
+
+
+class Heartbeat(threading.Thread):
+    """Extends a job's lease in the background while the catalog is processed.
+
+    `lost` turns true when the queue reports the job reclaimed, and also
+    when no heartbeat has succeeded for most of the lease, since another
+    worker may claim the job as soon as it runs out.
+    """
+
+    # Share of the lease after the last successful heartbeat that is still trusted
+    SAFETY = 0.9
+
+    def __init__(self, queue, job_id, worker_id, interval, lease_seconds=None):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lease_seconds = lease_seconds or interval * 3
+        self._reclaimed = False
+        self._valid_until = time.monotonic() + self.lease_seconds * self.SAFETY
+        # Not `_stop`: Thread.join() calls Thread._stop()
+        self._stopped = threading.Event()
+
+    @property
+    def lost(self):
+        return self._reclaimed or time.monotonic() > self._valid_until
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            started = time.monotonic()
+            try:
+                if not self.queue.heartbeat(self.job_id, self.worker_id):
+                    self._reclaimed = True
+                    return
+                self._valid_until = started + self.lease_seconds * self.SAFETY
+            except Exception as e:
+                print(f"Heartbeat failed for job {self.job_id}: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def after_ingest():
+    """Refresh the derived data that depends on newly ingested discounts"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from notification_matcher import run_matcher
+    from price_compare import rebuild_clusters
+
+    async def run():
+        db = AsyncIOMotorClient(MONGODB_URL).discount_hunter
+        await rebuild_clusters(db)
+        await run_matcher(db)
+
+    asyncio.run(run())
+
+
+def discard_previous_attempt(db, job_id):
+    """Delete the discounts an earlier attempt of the job stored, so a retry
+    after a crash or a lost lease does not store every product twice"""
+    from image_store import ImageStore
+
+    docs = list(db.discounts.find({"ingest_job_id": job_id}, {"_id": 1, "image_id": 1}))
+    if not docs:
+        return 0
+    ids = [doc["_id"] for doc in docs]
+    db.discounts.delete_many({"_id": {"$in": ids}})
+    ImageStore(db).release(doc.get("image_id") for doc in docs)
+    # Record the deletions so incremental backups can replay them
+    now = datetime.utcnow()
+    db.backup_tombstones.insert_many(
+        [{"collection": "discounts", "doc_id": _id, "deleted_at": now} for _id in ids], ordered=False
+    )
+    return len(ids)
+
+
+def process_job(db, job, lease=None):
+    """Ingest one job's catalog; `lease` (a Heartbeat) stops it once reclaimed"""
+    from catalog_processor import CatalogProcessor
+
+    if not os.path.exists(job["pdf_path"]):
+        raise FileNotFoundError(f"{job['pdf_path']} is not reachable from this worker; "
+                                "catalogs must be on storage shared by all workers")
+
+    discarded = discard_previous_attempt(db, job["_id"])
+    if discarded:
+        print(f"Job {job['_id']}: removed {discarded} discounts stored by an earlier attempt")
+
+    job_dir = os.path.join("work", str(job["_id"]))
+    processor = CatalogProcessor(
+        offer_start_date=job.get("offer_start_date"),
+        offer_end_date=job.get("offer_end_date"),
+        max_pages=job.get("max_pages", 10),
+        db=db,
+        output_folder=os.path.join(job_dir, "processed_catalogs"),
+        temp_folder=os.path.join(job_dir, "temp_pages"),
+        ingest_job_id=job["_id"],
+        lease=lease,
+    )
+    try:
+        summary = processor.process_catalog(job["store"], job["pdf_path"])
+    finally:
+        processor.cleanup()
+        shutil.rmtree(os.path.join(job_dir, "temp_pages"), ignore_errors=True)
+    failed = summary["counters"].get("pages_failed", 0)
+    if failed:
+        # Fail the attempt so the job is retried rather than marked done
+        # with pages missing; the retry discards what this attempt stored
+        raise RuntimeError(f"{failed} page(s) got no usable model answer")
+    return {"products": summary["counters"].get("products", 0)}
+
+
+def work(lease_seconds=300, poll_interval=5.0, run_after_ingest=False, once=False):
+    from image_store import ImageStore
+
+    client = MongoClient(MONGODB_URL)
+    db = client.discount_hunter
+    queue = IngestQueue(db, lease_seconds=lease_seconds)
+    queue.ensure_indexes()
+    ImageStore(db).ensure_indexes()
+    db.discounts.create_index("ingest_job_id", sparse=True)
+    worker_id = make_worker_id()
+    print(f"Worker {worker_id} started")
+
+    try:
+        while True:
+            queue.reap_exhausted()
+            job = queue.claim(worker_id)
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            print(f"Worker {worker_id} claimed job {job['_id']}: {job['store']} {job['pdf_path']} "
+                  f"(attempt {job['attempts']}/{job['max_attempts']})")
+            heartbeat = Heartbeat(queue, job["_id"], worker_id, lease_seconds / 3, lease_seconds)
+            heartbeat.start()
+            try:
+                result = process_job(db, job, lease=heartbeat)
+            except LeaseLost:
+                # The worker that reclaimed the job discards what this one stored
+                heartbeat.stop()
+                print(f"Job {job['_id']} lost its lease to another worker, stopped processing")
+                continue
+            except Exception as e:
+                heartbeat.stop()
+                print(f"Job {job['_id']} failed: {e}")
+                queue.fail(job["_id"], worker_id, "".join(traceback.format_exception_only(e)).strip())
+                continue
+            heartbeat.stop()
+
+            if heartbeat.lost:
+                print(f"Job {job['_id']} lost its lease to another worker")
+            elif queue.complete(job["_id"], worker_id, result):
+                print(f"Job {job['_id']} done: {result}")
+                if run_after_ingest:
+                    after_ingest()
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog ingestion queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add a catalog to the queue")
+    enqueue.add_argument("store")
+    enqueue.add_argument("pdf_path")
+    enqueue.add_argument("--start", dest="offer_start_date")
+    enqueue.add_argument("--end", dest="offer_end_date")
+    enqueue.add_argument("--priority", type=int, default=0)
+    enqueue.add_argument("--max-pages", type=int, default=10)
+
+    worker = commands.add_parser("work", help="process jobs until stopped")
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument("--lease-seconds", type=int, default=300)
+    worker.add_argument("--poll-interval", type=float, default=5.0)
+    worker.add_argument("--after-ingest", action="store_true",
+                        help="rebuild price clusters and match notifications after each job")
+    worker.add_argument("--once", action="store_true", help="exit when the queue is empty")
+
+    commands.add_parser("status", help="show job counts by status")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        client = MongoClient(MONGODB_URL)
+        queue = IngestQueue(client.discount_hunter)
+        job_id = queue.enqueue(args.store, args.pdf_path, args.offer_start_date,
+                               args.offer_end_date, args.priority, args.max_pages)
+        print(f"Enqueued job {job_id}")
+    elif args.command == "status":
+        client = MongoClient(MONGODB_URL)
+        print(IngestQueue(client.discount_hunter).counts())
+    else:
+        options = dict(lease_seconds=args.lease_seconds, poll_interval=args.poll_interval,
+                       run_after_ingest=args.after_ingest, once=args.once)
+        if args.processes == 1:
+            work(**options)
+            return
+        # Each process opens its own MongoClient after starting
+        processes = [multiprocessing.Process(target=work, kwargs=options) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
@@ -7,15 +7,26 @@ import os
 from dotenv import load_dotenv
 from bson import ObjectId
 import asyncio
+import mimetypes
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from metrics import MetricsMiddleware, MongoCommandListener, render_prometheus
+from response_cache import DataVersionTracker, ResponseCache, cache_key, etag_matches, serialize
+from trigram_index import TrigramIndex, build_index
+import suggest_index
+from price_compare import CLUSTER_COLLECTION, name_tokens
+from snapshot_engine import load_snapshot
+import thumbnails
+import page_tiles
 
 # Load environment variables
 load_dotenv()
 
 # MongoDB connection
-MONGODB_URL = "connection_url_string"
-client = AsyncIOMotorClient(MONGODB_URL)
+MONGODB_URL = os.getenv("MONGODB_URL", "connection_url_string")
+client = AsyncIOMotorClient(MONGODB_URL, event_listeners=[MongoCommandListener()])
 db = client.discount_hunter
 
 # Pydantic models
@@ -33,8 +44,12 @@ class Discount(BaseModel):
     offer_start_date: datetime
     offer_end_date: datetime
     trending_score: int = 0
-    quantity: Optional[int] = None
+    # As printed in the catalog, e.g. "400 g" or "6 x 0,5 l"
+    quantity: Optional[str] = None
     bounding_box: Optional[BoundingBox] = None
+    # Locate the page tiles under /tiles
+    catalog_id: Optional[str] = None
+    page_number: Optional[int] = None
 
 class ShoppingCartItem(BaseModel):
     user_id: str
@@ -44,9 +59,74 @@ class ShoppingCartItem(BaseModel):
 class Notification(BaseModel):
     user_id: str
     device_id: str
+    # Watch rules matched against each newly ingested catalog
+    keywords: List[str] = []
+    stores: List[str] = []
+    max_price: Optional[float] = None
+
+# Expired offers are moved here by archive_expired.py
+ARCHIVE_COLLECTION = "discounts_archive"
+
+# Search and trending responses only change when catalog data does
+response_cache = ResponseCache()
+data_version = DataVersionTracker(db)
+
+# In-memory trigram index over product names for typo-tolerant search
+name_index = TrigramIndex()
+FUZZY_CANDIDATES = 2000
+# Filtered fuzzy searches widen the candidate set up to this many names
+MAX_FUZZY_CANDIDATES = 128000
+
+async def refresh_name_index():
+    """Pick up newly ingested discounts, rebuilding if any were removed"""
+    global name_index
+    await name_index.load_new(db.discounts)
+    if len(name_index) != await db.discounts.estimated_document_count():
+        name_index = await build_index(db.discounts)
+
+data_version.add_listener(refresh_name_index)
+
+# Prefix suggestions, rebuilt in the background after each catalog ingest
+suggestions = suggest_index.EMPTY
+
+async def rebuild_suggestions():
+    global suggestions
+    documents = await db.discounts.find(
+        {"offer_end_date": {"$gt": datetime.utcnow()}},
+        {"item_description": 1, "normalized_name": 1, "trending_score": 1, "offer_end_date": 1}
+    ).to_list(length=None)
+    # Building sorts every term, keep it off the event loop
+    suggestions = await asyncio.to_thread(suggest_index.SuggestIndex.from_documents, documents)
+
+data_version.add_listener(rebuild_suggestions)
+
+# Encoded product thumbnails, cropped on demand from stored page rasters
+thumbnail_cache = thumbnails.ThumbnailCache()
+
+# Optional columnar snapshot answering filter/sort searches without Mongo
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "mongo")
+snapshot = None
+
+async def refresh_snapshot():
+    global snapshot
+    # Built completely before the swap, so requests never see a partial one
+    snapshot = await load_snapshot(db.discounts)
+
+if SEARCH_ENGINE == "snapshot":
+    data_version.add_listener(refresh_snapshot)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await data_version.start()
+    await refresh_name_index()
+    await rebuild_suggestions()
+    if SEARCH_ENGINE == "snapshot":
+        await refresh_snapshot()
+    yield
+    await data_version.stop()
 
 # Initialize FastAPI app with lifespan
-app = FastAPI(title="Discount Hunter API")
+app = FastAPI(title="Discount Hunter API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -57,86 +137,360 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Per-route latency and status counts, served at /metrics
+app.add_middleware(MetricsMiddleware)
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files whose URLs never change content, cacheable by clients and CDNs for a year"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+# Deep-zoom page tiles: /tiles/{catalog_id}/page_{n}.dzi and
+# /tiles/{catalog_id}/page_{n}_files/{level}/{col}_{row}.webp. The catalog_id
+# is a hash of the PDF, so a tile URL always serves the same bytes.
+mimetypes.add_type("application/xml", ".dzi")
+app.mount("/tiles", ImmutableStaticFiles(directory=page_tiles.TILE_STORE_DIR, check_dir=False), name="tiles")
+
+async def cached_json_response(request: Request, compute):
+    """Serve a cached serialized body for the request, computing it on a miss.
+
+    Clients that send a matching If-None-Match get an empty 304.
+    """
+    key = cache_key(request.url.path, request.query_params)
+    version = data_version.version
+    entry = response_cache.get(key, version)
+    if entry is None:
+        entry = response_cache.put(key, version, serialize(await compute()))
+    
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
 # API endpoints
 @app.get("/")
 async def root():
     return {"message": "Welcome to Discount Hunter API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/search")
 async def search_items(
+    request: Request,
     query: Optional[str] = None,
     store: Optional[str] = None,
     sort_by: Optional[str] = None,
     min_discount: Optional[float] = None,
     max_price: Optional[float] = None,
     limit: int = 500,
-    offset: int = 0
+    offset: int = 0,
+    fuzzy: bool = False,
+    min_similarity: float = 0.3,
+    batch_size: int = 100,
+    include_expired: bool = False
 ):
     try:
-        # Build search query
-        search_query = {}
-        if query:
-            search_query["item_description"] = {"$regex": query, "$options": "i"}
-        if store:
-            search_query["store"] = store
-        if min_discount:
-            search_query["discount_percentage"] = {"$gte": min_discount}
-        if max_price:
-            search_query["discount_price"] = {"$lte": max_price}
-
-        # Get total count for pagination
+        # Bulk consumers ask for NDJSON and get documents as the cursor yields them
+        if "application/x-ndjson" in request.headers.get("accept", ""):
+            return StreamingResponse(
+                _stream_search(query, store, sort_by, min_discount, max_price, limit, offset,
+                               fuzzy, min_similarity, max(1, batch_size), include_expired),
+                media_type="application/x-ndjson"
+            )
+        if query and fuzzy:
+            return await cached_json_response(
+                request,
+                lambda: _fuzzy_search(query, store, sort_by, min_discount, max_price,
+                                      limit, offset, min_similarity, include_expired)
+            )
+        current = snapshot
+        if current is not None and not query and not include_expired and current.supports(sort_by):
+            return await cached_json_response(
+                request,
+                lambda: _snapshot_search(current, store, sort_by, min_discount, max_price, limit, offset)
+            )
+        return await cached_json_response(
+            request,
+            lambda: _search(query, store, sort_by, min_discount, max_price, limit, offset,
+                            include_expired)
+        )
+    except Exception as e:
+        print(f"Error in search: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _filter_query(store, min_discount, max_price, include_expired=False):
+    search_query = {}
+    if not include_expired:
+        search_query["offer_end_date"] = {"$gt": datetime.utcnow()}
+    if store:
+        search_query["store"] = store
+    if min_discount:
+        search_query["discount_percentage"] = {"$gte": min_discount}
+    if max_price:
+        search_query["discount_price"] = {"$lte": max_price}
+    return search_query
+
+def _sort_query(sort_by):
+    sort_query = {}
+    if sort_by == "price":
+        sort_query["discount_price"] = 1
+    elif sort_by == "store":
+        sort_query["store"] = 1
+    elif sort_by == "date":
+        sort_query["offer_end_date"] = 1
+    elif sort_by == "trending":
+        sort_query["trending_score"] = -1
+    return sort_query
+
+def _find(search_query, sort_by, offset, limit, include_expired=False, batch_size=None):
+    """Cursor over live discounts, or over live and archived ones together"""
+    sort_query = _sort_query(sort_by)
+    if not include_expired:
+        cursor = db.discounts.find(search_query)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        if sort_query:
+            cursor = cursor.sort(list(sort_query.items()))
+        return cursor.skip(offset).limit(limit)
+    
+    pipeline = [
+        {"$match": search_query},
+        {"$unionWith": {"coll": ARCHIVE_COLLECTION, "pipeline": [{"$match": search_query}]}}
+    ]
+    if sort_query:
+        pipeline.append({"$sort": sort_query})
+    pipeline += [{"$skip": offset}, {"$limit": limit}]
+    return db.discounts.aggregate(pipeline, batchSize=batch_size) if batch_size else db.discounts.aggregate(pipeline)
+
+async def _count(search_query, include_expired=False):
+    total_count = await db.discounts.count_documents(search_query)
+    if include_expired:
+        total_count += await db[ARCHIVE_COLLECTION].count_documents(search_query)
+    return total_count
+
+async def _search(query, store, sort_by, min_discount, max_price, limit, offset, include_expired=False):
+    # Build search query
+    search_query = _filter_query(store, min_discount, max_price, include_expired)
+    if query:
+        search_query["item_description"] = {"$regex": query, "$options": "i"}
+
+    # Get total count for pagination
+    total_count = await _count(search_query, include_expired)
+
+    # Execute search with optional sorting
+    items = await _find(search_query, sort_by, offset, limit, include_expired).to_list(length=limit)
+    
+    # Convert ObjectId to string for JSON serialization
+    for item in items:
+        item["_id"] = str(item["_id"])
+        if "bounding_box" in item and item["bounding_box"]:
+            item["bounding_box"] = dict(item["bounding_box"])
+    
+    return {
+        "items": items,
+        "total": total_count,
+        "limit": limit,
+        "offset": offset,
+        "has_more": (offset + limit) < total_count
+    }
+
+async def _snapshot_search(current, store, sort_by, min_discount, max_price, limit, offset):
+    return current.search(store, min_discount, max_price, sort_by, limit, offset)
+
+async def _fuzzy_candidates(query, search_query, min_similarity, needed):
+    """Ranked (doc_id, similarity) candidates from the trigram index.
+
+    The index knows nothing of the store, price, discount and expiry
+    filters, so the candidate window grows until `needed` candidates pass
+    them or the index has no more names above the threshold. Returns the
+    candidates and whether they are every match.
+    """
+    window = FUZZY_CANDIDATES
+    while True:
+        ranked = name_index.search(query, threshold=min_similarity, limit=window)
+        complete = len(ranked) < window
+        if complete or window >= MAX_FUZZY_CANDIDATES:
+            return ranked, complete
+        ids = [ObjectId(doc_id) for doc_id, _ in ranked]
+        if await db.discounts.count_documents({**search_query, "_id": {"$in": ids}}) >= needed:
+            return ranked, False
+        window *= 4
+
+async def _fuzzy_search(query, store, sort_by, min_discount, max_price, limit, offset, min_similarity,
+                        include_expired=False):
+    # The trigram index only covers the hot collection, so archived offers
+    # are never fuzzy matches
+    search_query = _filter_query(store, min_discount, max_price, include_expired)
+    
+    # Candidates come from the in-memory trigram index, best match first
+    ranked, complete = await _fuzzy_candidates(query, search_query, min_similarity, offset + limit)
+    similarity = dict(ranked)
+    search_query["_id"] = {"$in": [ObjectId(doc_id) for doc_id, _ in ranked]}
+    
+    if sort_by:
         total_count = await db.discounts.count_documents(search_query)
+        items = await db.discounts.find(search_query).sort(_sort_query(sort_by)).skip(offset).limit(limit).to_list(length=limit)
+    else:
+        # Rank by similarity; the candidate set is small enough to order here
+        items = await db.discounts.find(search_query).to_list(length=None)
+        items.sort(key=lambda item: -similarity[str(item["_id"])])
+        total_count = len(items)
+        items = items[offset:offset + limit]
+    
+    for item in items:
+        item["_id"] = str(item["_id"])
+        item["similarity"] = round(similarity[item["_id"]], 4)
+        if "bounding_box" in item and item["bounding_box"]:
+            item["bounding_box"] = dict(item["bounding_box"])
+    
+    return {
+        "items": items,
+        "total": total_count,
+        "limit": limit,
+        "offset": offset,
+        "has_more": (offset + limit) < total_count or not complete,
+        # Counted among the candidates only, unless they were every match
+        "total_is_lower_bound": not complete
+    }
 
-        # Execute search with optional sorting
-        if sort_by:
-            sort_query = {}
-            if sort_by == "price":
-                sort_query["discount_price"] = 1
-            elif sort_by == "store":
-                sort_query["store"] = 1
-            elif sort_by == "date":
-                sort_query["offer_end_date"] = 1
-            elif sort_by == "trending":
-                sort_query["trending_score"] = -1
-            items = await db.discounts.find(search_query).sort(sort_query).skip(offset).limit(limit).to_list(length=limit)
-        else:
-            items = await db.discounts.find(search_query).skip(offset).limit(limit).to_list(length=limit)
-        
-        # Convert ObjectId to string for JSON serialization
-        for item in items:
-            item["_id"] = str(item["_id"])
-            if "bounding_box" in item and item["bounding_box"]:
-                item["bounding_box"] = dict(item["bounding_box"])
+@app.get("/api/suggest")
+async def suggest(prefix: str = "", limit: int = 10):
+    return suggestions.suggest(prefix, limit)
+
+@app.get("/api/compare")
+async def compare_prices(product: str, limit: int = 10):
+    try:
+        tokens = name_tokens(product)
+        if not tokens:
+            raise HTTPException(status_code=400, detail="Product name is required")
         
-        return {
-            "items": items,
-            "total": total_count,
-            "limit": limit,
-            "offset": offset,
-            "has_more": (offset + limit) < total_count
-        }
+        # One lookup on the multikey search_terms index, sorted before the
+        # limit so the closest names are never cut off: clusters with fewest
+        # extra words first, then cheapest
+        return await db[CLUSTER_COLLECTION].find(
+            {"search_terms": {"$all": tokens}}
+        ).sort(
+            [("term_count", 1), ("unit_price_missing", 1), ("sort_price", 1)]
+        ).limit(limit).to_list(length=limit)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in search: {str(e)}")
+        print(f"Error in compare_prices: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/trending")
-async def get_trending_items(limit: int = 10):
+async def _stream_search(query, store, sort_by, min_discount, max_price, limit, offset,
+                         fuzzy, min_similarity, batch_size, include_expired=False):
+    """Yield matching documents as NDJSON, one cursor batch per chunk.
+
+    Only one batch is held in memory at a time, whatever the limit, and no
+    total count is computed so the first line goes out immediately.
+    """
+    search_query = _filter_query(store, min_discount, max_price, include_expired)
+    ranked_ids = None
+    if query and fuzzy:
+        ranked, _ = await _fuzzy_candidates(query, search_query, min_similarity, offset + limit)
+        ranked_ids = [ObjectId(doc_id) for doc_id, _ in ranked]
+    elif query:
+        search_query["item_description"] = {"$regex": query, "$options": "i"}
+    
     try:
-        items = await db.discounts.find({
-            "offer_end_date": {"$gt": datetime.utcnow()}
-        }).sort("trending_score", -1).limit(limit).to_list(length=limit)
+        if ranked_ids is not None and not sort_by:
+            # Keep similarity order by fetching the ranked ids chunk by chunk
+            sent = skipped = 0
+            for i in range(0, len(ranked_ids), batch_size):
+                chunk = ranked_ids[i:i + batch_size]
+                found = {doc["_id"]: doc async for doc in db.discounts.find({**search_query, "_id": {"$in": chunk}})}
+                lines = []
+                for doc_id in chunk:
+                    if doc_id not in found:
+                        continue
+                    if skipped < offset:
+                        skipped += 1
+                        continue
+                    lines.append(serialize(found[doc_id]) + b"\n")
+                    sent += 1
+                    if sent >= limit:
+                        break
+                if lines:
+                    yield b"".join(lines)
+                if sent >= limit:
+                    return
+            return
         
-        # Convert ObjectId to string for JSON serialization
-        for item in items:
-            item["_id"] = str(item["_id"])
-            if "bounding_box" in item and item["bounding_box"]:
-                item["bounding_box"] = dict(item["bounding_box"])
+        if ranked_ids is not None:
+            search_query["_id"] = {"$in": ranked_ids}
+        cursor = _find(search_query, sort_by, offset, limit, include_expired and ranked_ids is None,
+                       batch_size=batch_size)
         
-        return items
+        lines = []
+        async for item in cursor:
+            lines.append(serialize(item) + b"\n")
+            if len(lines) >= batch_size:
+                yield b"".join(lines)
+                lines = []
+        if lines:
+            yield b"".join(lines)
+    except Exception as e:
+        # Headers are already sent, so the stream just ends early
+        print(f"Error in search stream: {str(e)}")
+
+@app.get("/api/discounts/{discount_id}/image")
+async def get_discount_image(request: Request, discount_id: str, w: int = 256):
+    try:
+        if not ObjectId.is_valid(discount_id):
+            raise HTTPException(status_code=404, detail="Discount not found")
+        projection = {"bounding_box": 1, "catalog_id": 1, "page_number": 1}
+        discount = await db.discounts.find_one({"_id": ObjectId(discount_id)}, projection)
+        if discount is None:
+            discount = await db[ARCHIVE_COLLECTION].find_one({"_id": ObjectId(discount_id)}, projection)
+        if discount is None:
+            raise HTTPException(status_code=404, detail="Discount not found")
+        if not discount.get("bounding_box") or not discount.get("catalog_id"):
+            raise HTTPException(status_code=404, detail="No page image stored for this discount")
+        
+        width = thumbnails.normalize_width(w)
+        etag = f'"{thumbnails.thumbnail_key(discount)}-{width}"'
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=604800"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        
+        # Decoding and encoding images is CPU-bound, keep it off the event loop
+        data = await asyncio.to_thread(thumbnail_cache.get_or_render, discount, width)
+        return Response(content=data, media_type="image/webp", headers=headers)
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Page image not found")
+    except Exception as e:
+        print(f"Error in get_discount_image: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/trending")
+async def get_trending_items(request: Request, limit: int = 10):
+    try:
+        return await cached_json_response(request, lambda: _trending(limit))
     except Exception as e:
         print(f"Error in trending: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _trending(limit):
+    items = await db.discounts.find({
+        "offer_end_date": {"$gt": datetime.utcnow()}
+    }).sort("trending_score", -1).limit(limit).to_list(length=limit)
+    
+    # Convert ObjectId to string for JSON serialization
+    for item in items:
+        item["_id"] = str(item["_id"])
+        if "bounding_box" in item and item["bounding_box"]:
+            item["bounding_box"] = dict(item["bounding_box"])
+    
+    return items
+
 @app.post("/api/shopping-cart")
 async def add_to_cart(item: ShoppingCartItem):
     try:
@@ -205,14 +559,21 @@ async def get_shopping_cart(user_id: str):
 @app.delete("/api/shopping-cart/{user_id}/{item_id}")
 async def remove_from_cart(user_id: str, item_id: str):
     try:
-        result = await db.shopping_cart.delete_one({
+        deleted = await db.shopping_cart.find_one_and_delete({
             "user_id": user_id,
             "discount_id": item_id
-        })
+        }, projection={"_id": 1})
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Item not found in cart")
         
+        # Record the deletion so incremental backups can replay it
+        await db.backup_tombstones.insert_one({
+            "collection": "shopping_cart",
+            "doc_id": deleted["_id"],
+            "deleted_at": datetime.utcnow()
+        })
+        
         return {"message": "Item removed from cart"}
     except Exception as e:
         print(f"Error in remove_from_cart: {str(e)}")
@@ -230,12 +591,12 @@ async def add_notification(notification: Notification):
             # Update existing preferences
             result = await db.notifications.update_one(
                 {"user_id": notification.user_id},
-                {"$set": notification.dict()}
+                {"$set": {**notification.dict(), "updated_at": datetime.utcnow()}}
             )
             return {"message": "Notification preferences updated"}
         else:
             # Create new preferences
-            result = await db.notifications.insert_one(notification.dict())
+            result = await db.notifications.insert_one({**notification.dict(), "updated_at": datetime.utcnow()})
             return {"message": "Notification preferences saved", "id": str(result.inserted_id)}
     except Exception as e:
         print(f"Error in add_notification: {str(e)}")
@@ -0,0 +1,208 @@
+"""In-process request and MongoDB metrics exposed in Prometheus text format.
+
+Recording an observation is a dict lookup, a bisect and a few additions
+under a lock, cheap enough to leave on in production. The API serves the
+result at /metrics.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += counts[-1]
+            le = _format_labels(self.label_names, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.",
+    ("method", "route"), HTTP_BUCKETS,
+)
+http_responses = Counter(
+    "http_responses_total", "HTTP responses by route and status code.",
+    ("method", "route", "status"),
+)
+mongo_command_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by collection and command.",
+    ("collection", "command"), MONGO_BUCKETS,
+)
+mongo_command_failures = Counter(
+    "mongodb_command_failures_total", "Failed MongoDB commands by collection and command.",
+    ("collection", "command"),
+)
+mongo_documents_returned = Counter(
+    "mongodb_documents_returned_total", "Documents returned in cursor batches.",
+    ("collection", "command"),
+)
+
+REGISTRY = [
+    http_request_duration, http_responses,
+    mongo_command_duration, mongo_command_failures, mongo_documents_returned,
+]
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and status per route template.
+
+    Routes are labelled by their path template (``/api/shopping-cart/{user_id}``)
+    rather than the raw path, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route_label(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            # The router is complete once requests are served
+            router = scope["app"].router
+            # Mounted apps such as /tiles are the endpoint of their requests
+            self._route_paths = {
+                getattr(route, "endpoint", getattr(route, "app", None)): route.path
+                for route in router.routes
+            }
+        return self._route_paths.get(endpoint, getattr(endpoint, "__name__", "unknown"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            route = self._route_label(scope)
+            method = scope["method"]
+            http_request_duration.observe((method, route), elapsed)
+            http_responses.inc((method, route, str(status)))
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records per-collection, per-command latency and returned document counts"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        command = event.command
+        if event.command_name == "getMore":
+            collection = command.get("collection", "")
+        else:
+            collection = command.get(event.command_name, "")
+            if not isinstance(collection, str):
+                # Admin commands such as {"ping": 1}
+                collection = ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, event.command_name)
+
+    def _pop(self, event):
+        with self._lock:
+            return self._pending.pop(
+                (event.connection_id, event.request_id), ("", event.command_name)
+            )
+
+    def succeeded(self, event):
+        labels = self._pop(event)
+        mongo_command_duration.observe(labels, event.duration_micros / 1_000_000)
+        cursor = event.reply.get("cursor") if hasattr(event.reply, "get") else None
+        if cursor:
+            batch = cursor.get("firstBatch", cursor.get("nextBatch", ()))
+            if batch:
+                mongo_documents_returned.inc(labels, len(batch))
+
+    def failed(self, event):
+        labels = self._pop(event)
+        mongo_command_duration.observe(labels, event.duration_micros / 1_000_000)
+        mongo_command_failures.inc(labels)
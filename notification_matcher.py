@@ -0,0 +1,273 @@
+"""Match newly ingested discounts against users' watch rules.
+
+Each user registered in ``notifications`` can watch keywords, restrict them
+to stores and a maximum price; the products already in their shopping cart
+are watched too. All rules are loaded into an inverted index from a name
+token to the rules containing it, so one pass over the new discounts finds
+every interested user without a query per user. Matches are grouped into
+one notification per user and handed to a batching delivery sink.
+
+Discounts are claimed for matching with an atomic update rather than read
+past a watermark, so matchers in parallel ingest workers never deliver
+the same discount twice and never skip one committed out of _id order.
+
+    python notification_matcher.py   # run after a catalog ingest
+"""
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from price_compare import name_tokens
+
+# A claim this old belongs to a matcher that died before delivering
+CLAIM_TIMEOUT = timedelta(minutes=30)
+
+
+class WatchRule:
+    __slots__ = ("user_id", "tokens", "stores", "max_price", "source", "exclude_id")
+
+    def __init__(self, user_id, tokens, stores=None, max_price=None, source="keyword", exclude_id=None):
+        self.user_id = user_id
+        self.tokens = frozenset(tokens)
+        self.stores = frozenset(stores) if stores else None
+        self.max_price = max_price
+        self.source = source
+        # A cart rule must not match the very offer that is in the cart
+        self.exclude_id = exclude_id
+
+    def accepts(self, discount):
+        if self.stores is not None and discount.get("store") not in self.stores:
+            return False
+        if self.max_price is not None:
+            price = discount.get("discount_price")
+            if price is None or price > self.max_price:
+                return False
+        return str(discount.get("_id")) != self.exclude_id
+
+
+def rules_for_watcher(watcher, cart_discounts=()):
+    """Build the rules of one `notifications` document and its cart items"""
+    user_id = watcher["user_id"]
+    rules = []
+    for keyword in watcher.get("keywords") or []:
+        tokens = name_tokens(keyword)
+        if tokens:
+            rules.append(WatchRule(user_id, tokens, watcher.get("stores"), watcher.get("max_price")))
+    for discount in cart_discounts:
+        tokens = name_tokens(discount.get("item_description"))
+        if tokens:
+            # Any store, but only if it beats what the cart item costs
+            rules.append(WatchRule(user_id, tokens, max_price=discount.get("discount_price"),
+                                   source="cart", exclude_id=str(discount["_id"])))
+    return rules
+
+
+class WatchIndex:
+    def __init__(self, rules=()):
+        self._index = defaultdict(list)
+        self.rule_count = 0
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule):
+        # Index on the longest token: a rule matches only if all its tokens
+        # are present, and long tokens have the shortest posting lists
+        self._index[max(rule.tokens, key=lambda t: (len(t), t))].append(rule)
+        self.rule_count += 1
+
+    def match(self, discounts):
+        """Map user_id to the {discount, sources} matches among `discounts`"""
+        matches = defaultdict(dict)
+        for discount in discounts:
+            tokens = set(name_tokens(discount.get("item_description")))
+            for token in tokens:
+                for rule in self._index.get(token, ()):
+                    if rule.tokens <= tokens and rule.accepts(discount):
+                        match = matches[rule.user_id].setdefault(
+                            str(discount["_id"]), {"discount": discount, "sources": set()}
+                        )
+                        match["sources"].add(rule.source)
+        return matches
+
+
+class DeliverySink(ABC):
+    """Destination for notifications; implementations deliver a whole batch at once"""
+
+    @abstractmethod
+    def send_batch(self, notifications):
+        ...
+
+
+class PrintSink(DeliverySink):
+    def send_batch(self, notifications):
+        for notification in notifications:
+            print(f"Notify {notification['user_id']} on {notification['device_id']}: {notification['title']}")
+
+
+class FakeSink(DeliverySink):
+    """Keeps delivered batches in memory, for tests"""
+
+    def __init__(self):
+        self.batches = []
+
+    def send_batch(self, notifications):
+        self.batches.append(list(notifications))
+
+    @property
+    def notifications(self):
+        return [n for batch in self.batches for n in batch]
+
+
+class BatchingSink:
+    """Buffers notifications and forwards them to `sink` in batches"""
+
+    def __init__(self, sink, batch_size=500):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.sent = 0
+        self._buffer = []
+
+    def add(self, notification):
+        self._buffer.append(notification)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.sink.send_batch(self._buffer)
+            self.sent += len(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+
+
+def build_notifications(matches, devices):
+    """One notification per user summarizing all of their matched offers"""
+    for user_id, user_matches in matches.items():
+        offers = sorted(
+            user_matches.values(), key=lambda m: m["discount"].get("discount_price") or 0
+        )
+        best = offers[0]["discount"]
+        title = f"{best.get('item_description')} v {best.get('store')} za {best.get('discount_price')} €"
+        if len(offers) > 1:
+            title += f" in še {len(offers) - 1} ponudb"
+        for device_id in devices.get(user_id, ()):
+            yield {
+                "user_id": user_id,
+                "device_id": device_id,
+                "title": title,
+                "discount_ids": [str(m["discount"]["_id"]) for m in offers],
+                "sources": sorted(set().union(*(m["sources"] for m in offers))),
+            }
+
+
+def deliver_matches(watchers, cart_discounts, new_discounts, sink, batch_size=500):
+    """Match `new_discounts` for all watchers and deliver through `sink`.
+
+    `cart_discounts` maps user_id to the discount documents in their cart.
+    Returns the number of notifications delivered.
+    """
+    rules = []
+    devices = defaultdict(list)
+    for watcher in watchers:
+        devices[watcher["user_id"]].append(watcher["device_id"])
+        rules.extend(rules_for_watcher(watcher, cart_discounts.get(watcher["user_id"], ())))
+    # Identical rules, e.g. the same product in the cart twice, are indexed once
+    index = WatchIndex({(r.user_id, r.tokens, r.stores, r.max_price, r.source, r.exclude_id): r
+                        for r in rules}.values())
+
+    batching = BatchingSink(sink, batch_size)
+    for notification in build_notifications(index.match(new_discounts), devices):
+        batching.add(notification)
+    batching.close()
+    return batching.sent
+
+
+async def _load_cart_discounts(db, user_ids, chunk_size=10_000):
+    cart_items = await db.shopping_cart.find(
+        {"user_id": {"$in": list(user_ids)}}, {"user_id": 1, "discount_id": 1}
+    ).to_list(length=None)
+    discount_ids = list({ObjectId(item["discount_id"]) for item in cart_items})
+    discounts = {}
+    for i in range(0, len(discount_ids), chunk_size):
+        async for doc in db.discounts.find(
+            {"_id": {"$in": discount_ids[i:i + chunk_size]}},
+            {"item_description": 1, "discount_price": 1}
+        ):
+            discounts[str(doc["_id"])] = doc
+    by_user = defaultdict(list)
+    for item in cart_items:
+        discount = discounts.get(str(item["discount_id"]))
+        if discount is not None:
+            by_user[item["user_id"]].append(discount)
+    return by_user
+
+
+async def ensure_indexes(db):
+    # Only pending discounts are indexed
+    await db.discounts.create_index(
+        [("notified", 1), ("notify_claimed_at", 1)], partialFilterExpression={"notified": False}
+    )
+
+
+async def _claim_pending(db, now):
+    """Atomically take the live discounts awaiting notification; returns the claim token.
+
+    update_many changes each document atomically, so matchers running in
+    parallel ingest workers claim disjoint sets. A claim older than
+    CLAIM_TIMEOUT belongs to a matcher that died and is taken over.
+    """
+    token = ObjectId()
+    await db.discounts.update_many(
+        {
+            "notified": False,
+            "offer_end_date": {"$gt": now},
+            "$or": [{"notify_claim": None}, {"notify_claimed_at": {"$lt": now - CLAIM_TIMEOUT}}],
+        },
+        {"$set": {"notify_claim": token, "notify_claimed_at": now}},
+    )
+    return token
+
+
+async def run_matcher(db, sink=None):
+    """Notify watchers about discounts stored since they were last matched.
+
+    The catalog processor stores every discount with ``notified: False``;
+    discounts without the field predate the matcher and are never sent.
+    """
+    sink = sink or PrintSink()
+    now = datetime.utcnow()
+    await ensure_indexes(db)
+    token = await _claim_pending(db, now)
+    new_discounts = await db.discounts.find(
+        {"notify_claim": token}, {"item_description": 1, "discount_price": 1, "store": 1}
+    ).to_list(length=None)
+    if not new_discounts:
+        print("No new discounts to match")
+        return 0
+
+    watchers = await db.notifications.find({}).to_list(length=None)
+    cart_discounts = await _load_cart_discounts(db, {w["user_id"] for w in watchers})
+    sent = deliver_matches(watchers, cart_discounts, new_discounts, sink)
+
+    await db.discounts.update_many(
+        {"notify_claim": token},
+        {"$set": {"notified": True}, "$unset": {"notify_claim": "", "notify_claimed_at": ""}},
+    )
+    print(f"Matched {len(new_discounts)} new discounts against {len(watchers)} watchers, "
+          f"sent {sent} notifications")
+    return sent
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    # MongoDB connection
+    MONGODB_URL = os.getenv("MONGODB_URL", "connection_url_string")
+    client = AsyncIOMotorClient(MONGODB_URL)
+    asyncio.run(run_matcher(client.discount_hunter))
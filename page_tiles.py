@@ -0,0 +1,99 @@
+"""Deep Zoom tile pyramids of catalog pages for the mobile client.
+
+Every rendered page is cut into 256px WebP tiles at each zoom level, in the
+Deep Zoom (DZI) layout that OpenSeadragon and the common mobile viewers
+read directly:
+
+    TILE_STORE_DIR/{catalog_id}/page_{n}.dzi
+    TILE_STORE_DIR/{catalog_id}/page_{n}_files/{level}/{col}_{row}.webp
+
+Level ``max`` is the full 300 DPI raster, so discount bounding boxes apply
+to it unchanged; each level below halves the size down to 1x1 at level 0.
+Levels are built by downscaling the previous one, and the tiles of a level
+are encoded on a thread pool (Pillow releases the GIL while encoding).
+``catalog_id`` is a content hash of the PDF, so tile URLs never change
+meaning and can be cached forever.
+"""
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+TILE_STORE_DIR = os.getenv("TILE_STORE_DIR", "page_tiles")
+TILE_SIZE = 256
+TILE_FORMAT = "webp"
+WEBP_QUALITY = 80
+
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" '
+    'Overlap="0" Format="{format}">\n'
+    '  <Size Width="{width}" Height="{height}"/>\n'
+    '</Image>\n'
+)
+
+
+def descriptor_path(catalog_id, page_number, root=TILE_STORE_DIR):
+    return os.path.join(root, str(catalog_id), f"page_{page_number}.dzi")
+
+
+def max_level(width, height):
+    return math.ceil(math.log2(max(width, height, 1)))
+
+
+def _write_tile(image, path):
+    temp_path = f"{path}.tmp"
+    image.save(temp_path, format="WEBP", quality=WEBP_QUALITY, method=4)
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+def build_pyramid(image_path, catalog_id, page_number, root=TILE_STORE_DIR, executor=None):
+    """Write the tiles and descriptor of one page; returns (tiles, bytes) written.
+
+    A page whose descriptor exists is skipped, since the same catalog_id
+    always renders the same pixels. The descriptor is written last, so a
+    crash never leaves a page that looks complete.
+    """
+    descriptor = descriptor_path(catalog_id, page_number, root)
+    if os.path.exists(descriptor):
+        return 0, 0
+    files_dir = os.path.join(root, str(catalog_id), f"page_{page_number}_files")
+
+    with Image.open(image_path) as page:
+        level_image = page.convert("RGB")
+    width, height = level_image.size
+    top = max_level(width, height)
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    try:
+        futures = []
+        for level in range(top, -1, -1):
+            if level < top:
+                scale = 2 ** (top - level)
+                size = (max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale)))
+                level_image = level_image.resize(size, Image.LANCZOS)
+            level_dir = os.path.join(files_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            level_width, level_height = level_image.size
+            for row in range(math.ceil(level_height / TILE_SIZE)):
+                for col in range(math.ceil(level_width / TILE_SIZE)):
+                    box = (col * TILE_SIZE, row * TILE_SIZE,
+                           min(level_width, (col + 1) * TILE_SIZE), min(level_height, (row + 1) * TILE_SIZE))
+                    # Cropped here so the workers only encode
+                    tile = level_image.crop(box)
+                    path = os.path.join(level_dir, f"{col}_{row}.{TILE_FORMAT}")
+                    futures.append(executor.submit(_write_tile, tile, path))
+        written = sum(future.result() for future in futures)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    temp_path = f"{descriptor}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(DZI_TEMPLATE.format(tile_size=TILE_SIZE, format=TILE_FORMAT, width=width, height=height))
+    os.replace(temp_path, descriptor)
+    return len(futures), written
@@ -0,0 +1,167 @@
+"""Group discounts into canonical products across stores for price comparison.
+
+Offers are clustered on their normalized name (quantity words removed) and
+the dimension of their quantity, so "Banane za kg" from Lidl and "Banane
+1 kg" from Spar land in the same cluster. Each cluster keeps the cheapest
+live offer per store with its unit price (per kg, l or piece). Clusters
+are written to ``product_clusters`` and looked up by the API through a
+multikey index on their name tokens.
+
+    python price_compare.py   # rebuild after catalog ingest
+"""
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from trigram_index import normalize
+
+CLUSTER_COLLECTION = "product_clusters"
+
+# Unit -> (base unit, factor to the base unit)
+UNITS = {
+    "kg": ("kg", 1.0), "dag": ("kg", 0.01), "g": ("kg", 0.001), "mg": ("kg", 0.000001),
+    "l": ("l", 1.0), "dl": ("l", 0.1), "cl": ("l", 0.01), "ml": ("l", 0.001),
+    "kos": ("kos", 1.0), "kosov": ("kos", 1.0), "kom": ("kos", 1.0), "rol": ("kos", 1.0),
+}
+_QUANTITY = re.compile(
+    r"(?:(\d+)\s*[x×]\s*)?(\d+(?:[.,]\d+)?)\s*(kg|dag|g|mg|l|dl|cl|ml|kosov|kos|kom|rol)\b"
+)
+# "za kg" / "za kos": the price is already per unit
+_PER_UNIT = re.compile(r"\bza\s+(kg|l|kos)\b")
+# "pribl. 1,3 kg": a weighed piece, the amount is only an estimate
+_APPROXIMATE = re.compile(r"\b(?:pribl|cca|ca)\b")
+
+# Words that describe the offer rather than the product
+STOP_WORDS = {"za", "pribl", "cca", "akcija", "novo", "le", "samo"}
+
+
+def parse_quantity(text):
+    """Parse a quantity like "400 g", "6 x 0,5 l" or "za kg" into (amount, base unit).
+
+    Approximate weights give no amount, so no unit price is derived from them.
+    """
+    if not text:
+        return None, None
+    text = str(text).lower()
+    match = _QUANTITY.search(text)
+    if match:
+        count, amount, unit = match.groups()
+        base, factor = UNITS[unit]
+        if _APPROXIMATE.search(text[:match.start()]):
+            return None, base
+        total = float(amount.replace(",", ".")) * factor * (int(count) if count else 1)
+        return (total, base) if total > 0 else (None, None)
+    match = _PER_UNIT.search(text)
+    if match:
+        return 1.0, match.group(1)
+    return None, None
+
+
+def name_tokens(name):
+    """Normalized name words that identify the product"""
+    tokens = []
+    # "Pivo Laško 0,5 l" names the same product as "Pivo Laško"
+    name = _QUANTITY.sub(" ", str(name or "").lower())
+    for token in normalize(name).split():
+        if token in STOP_WORDS or token in UNITS:
+            continue
+        tokens.append(token)
+    return tokens
+
+
+def cluster_key(name, base_unit):
+    tokens = sorted(set(name_tokens(name)))
+    return " ".join(tokens) + "|" + (base_unit or "-")
+
+
+def cluster_discounts(documents):
+    """Group discount documents into cluster documents ready to store"""
+    offers = defaultdict(list)
+    spellings = defaultdict(Counter)
+    for doc in documents:
+        price = doc.get("discount_price")
+        if not price:
+            continue
+        amount, base_unit = parse_quantity(doc.get("quantity"))
+        key = cluster_key(doc.get("item_description"), base_unit)
+        if key.startswith("|"):
+            continue
+        offers[key].append((doc, amount, base_unit))
+        spellings[key][" ".join(str(doc.get("item_description")).split())] += 1
+
+    clusters = []
+    for key, members in offers.items():
+        cheapest = {}
+        for doc, amount, base_unit in members:
+            price = doc["discount_price"]
+            unit_price = round(price / amount, 4) if amount else None
+            store = doc.get("store")
+            # Compare per unit when the quantity is known, else by shelf price
+            rank = unit_price if unit_price is not None else price
+            current = cheapest.get(store)
+            if current is None or rank < current["_rank"]:
+                cheapest[store] = {
+                    "_rank": rank,
+                    "store": store,
+                    "discount_id": str(doc["_id"]),
+                    "price": price,
+                    "unit_price": unit_price,
+                    "quantity": doc.get("quantity"),
+                    "offer_end_date": doc.get("offer_end_date"),
+                }
+        stores = sorted(cheapest.values(), key=lambda s: s["_rank"])
+        for entry in stores:
+            del entry["_rank"]
+        unit_prices = [s["unit_price"] for s in stores if s["unit_price"] is not None]
+        name, unit = key.split("|")
+        clusters.append({
+            "_id": key,
+            "name": spellings[key].most_common(1)[0][0],
+            "unit": None if unit == "-" else unit,
+            "search_terms": name.split(),
+            # Sort keys for the API: closest names first, then cheapest
+            "term_count": len(name.split()),
+            "unit_price_missing": not unit_prices,
+            "sort_price": min(unit_prices) if unit_prices else min(s["price"] for s in stores),
+            "stores": stores,
+            "store_count": len(stores),
+            "offer_count": len(members),
+            "min_price": min(s["price"] for s in stores),
+            "min_unit_price": min(unit_prices) if unit_prices else None,
+        })
+    return clusters
+
+
+async def rebuild_clusters(db, batch_size=1000):
+    """Recompute clusters from live discounts and swap them in atomically"""
+    now = datetime.utcnow()
+    documents = await db.discounts.find(
+        {"offer_end_date": {"$gt": now}},
+        {"item_description": 1, "discount_price": 1, "store": 1, "quantity": 1, "offer_end_date": 1}
+    ).to_list(length=None)
+    clusters = cluster_discounts(documents)
+    for cluster in clusters:
+        cluster["updated_at"] = now
+
+    staging = db[f"{CLUSTER_COLLECTION}_staging"]
+    await staging.drop()
+    for i in range(0, len(clusters), batch_size):
+        await staging.insert_many(clusters[i:i + batch_size], ordered=False)
+    await staging.create_index([("search_terms", 1), ("term_count", 1)])
+    if clusters:
+        await staging.rename(CLUSTER_COLLECTION, dropTarget=True)
+    else:
+        await db[CLUSTER_COLLECTION].delete_many({})
+    print(f"Built {len(clusters)} product clusters from {len(documents)} live offers")
+    return len(clusters)
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    # MongoDB connection
+    MONGODB_URL = os.getenv("MONGODB_URL", "connection_url_string")
+    client = AsyncIOMotorClient(MONGODB_URL)
+    asyncio.run(rebuild_clusters(client.discount_hunter))
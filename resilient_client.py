@@ -0,0 +1,218 @@
+"""Deadlines, retries, hedging and a circuit breaker around model calls.
+
+``ResilientModelClient`` wraps anything with ``models.generate_content``
+(``genai.Client`` or FakeModelClient). Every attempt runs on a worker
+thread and is abandoned once it passes its deadline. Failed, timed out and
+unparseable attempts are retried with full-jitter exponential backoff.
+With hedging on, a duplicate request is sent when an attempt has been
+running longer than the recent p95 latency, and whichever answers first
+wins. A circuit breaker pauses dispatch for a cooldown when most recent
+attempts failed instead of hammering a struggling API.
+
+``stats()`` reports attempts per call, outcomes and the latency
+distribution.
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class ModelCallError(Exception):
+    """A model call that still failed after its last attempt"""
+
+    def __init__(self, message, attempts):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class CallResult:
+    __slots__ = ("response", "value", "attempts", "hedged")
+
+    def __init__(self, response, value, attempts, hedged):
+        self.response = response
+        # Whatever the parse callback returned for the response
+        self.value = value
+        self.attempts = attempts
+        self.hedged = hedged
+
+
+class CircuitBreaker:
+    """Opens when `failure_ratio` of the last `window` attempts failed.
+
+    While open, dispatch waits out the cooldown. The first attempt after it
+    closes the breaker again on success or reopens it on failure.
+    """
+
+    def __init__(self, window=20, failure_ratio=0.5, min_calls=5, cooldown=30.0):
+        self.results = deque(maxlen=window)
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.opened_at = None
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        """Seconds to hold off before the next dispatch, 0 when closed"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def record(self, success):
+        with self._lock:
+            if self.opened_at is not None:
+                if success:
+                    self.opened_at = None
+                    self.results.clear()
+                else:
+                    self._open()
+                return
+            self.results.append(success)
+            failures = self.results.count(False)
+            if len(self.results) >= self.min_calls and failures / len(self.results) >= self.failure_ratio:
+                self._open()
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.opens += 1
+        print(f"Model circuit breaker open, pausing calls for {self.cooldown:.0f}s")
+
+
+class ResilientModelClient:
+    def __init__(self, client, deadline=120.0, max_attempts=4, base_delay=1.0, max_delay=30.0,
+                 hedge=False, hedge_min_samples=20, breaker=None, max_workers=8, sleep=time.sleep):
+        self.client = client
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        # Timed out attempts keep their thread until the API answers, so the
+        # pool is larger than the one call in flight a processor needs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-call")
+        self._latencies = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self.attempts_per_call = Counter()
+        self.outcomes = Counter()
+
+    def _count(self, outcome, amount=1):
+        with self._lock:
+            self.outcomes[outcome] += amount
+
+    def hedge_delay(self):
+        """Recent p95 latency, or None while hedging is off or unwarmed"""
+        with self._lock:
+            if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _attempt(self, model, contents):
+        """One attempt, hedged if it outlives the p95; returns (response, hedged)"""
+        started = time.monotonic()
+
+        def call():
+            return self.client.models.generate_content(model=model, contents=contents)
+
+        futures = [self._pool.submit(call)]
+        delay = self.hedge_delay()
+        if delay is not None and delay < self.deadline:
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                futures.append(self._pool.submit(call))
+                self._count("hedges")
+
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = self.deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    with self._lock:
+                        self._latencies.append(time.monotonic() - started)
+                    if future is not futures[0]:
+                        self._count("hedges_won")
+                    return future.result(), len(futures) > 1
+                error = future.exception()
+        if pending:
+            for future in pending:
+                future.cancel()
+            raise TimeoutError(f"no answer within the {self.deadline:.0f}s deadline")
+        raise error
+
+    def generate(self, model, contents, parse=None):
+        """Call the model until `parse(response)` succeeds or attempts run out.
+
+        `parse` raises ValueError for responses that should be re-requested.
+        """
+        last_error = None
+        for attempt in range(1, self.max_attempts + 1):
+            pause = self.breaker.wait_time()
+            if pause:
+                self._count("breaker_waits")
+                self.sleep(pause)
+
+            try:
+                response, hedged = self._attempt(model, contents)
+            except TimeoutError as e:
+                outcome, last_error = "timeouts", e
+            except Exception as e:
+                outcome, last_error = "errors", e
+            else:
+                self.breaker.record(True)
+                try:
+                    value = parse(response) if parse else response
+                except ValueError as e:
+                    outcome, last_error = "malformed", e
+                else:
+                    with self._lock:
+                        self.attempts_per_call[attempt] += 1
+                    return CallResult(response, value, attempt, hedged)
+
+            self._count(outcome)
+            if outcome != "malformed":
+                self.breaker.record(False)
+            print(f"Model call attempt {attempt}/{self.max_attempts} failed ({outcome}): {last_error}")
+            if attempt < self.max_attempts:
+                self.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+
+        with self._lock:
+            self.attempts_per_call[self.max_attempts] += 1
+        self._count("failed_calls")
+        raise ModelCallError(f"gave up after {self.max_attempts} attempts: {last_error}",
+                             self.max_attempts) from last_error
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            attempts = dict(sorted(self.attempts_per_call.items()))
+            outcomes = dict(self.outcomes)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 1)
+
+        stats = {
+            "calls": sum(attempts.values()),
+            "attempts_per_call": attempts,
+            "breaker_opens": self.breaker.opens,
+            "latency_ms": {
+                "p50": percentile(0.5), "p90": percentile(0.9), "p95": percentile(0.95),
+                "p99": percentile(0.99), "max": round(latencies[-1] * 1000, 1),
+            } if latencies else {},
+        }
+        stats.update(outcomes)
+        return stats
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
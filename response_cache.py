@@ -0,0 +1,230 @@
+"""Server-side cache of serialized API responses.
+
+Catalog data only changes when a catalog is ingested, archived or
+restored, so search and trending responses are cached as pre-serialized
+JSON bodies keyed by path and normalized query parameters. Entries are
+tagged with the data version they were built from and are dropped once it
+moves on. Writers bump the version document with ``bump_data_version``.
+When the deployment is a replica set, a change stream on ``discounts`` is
+watched as well, so writes that skip the bump still invalidate the cache.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+DATA_VERSION_ID = "data_version"
+
+
+def bump_data_version(db):
+    """Mark catalog data as changed.
+
+    The version is a fresh ObjectId rather than a counter: restoring a
+    backup of ``meta`` can bring back an old counter value that a running
+    tracker already holds, and then nothing would be invalidated.
+
+    Works with both pymongo and motor databases; with motor the result
+    must be awaited.
+    """
+    return db.meta.update_one(
+        {"_id": DATA_VERSION_ID},
+        {"$set": {"version": ObjectId(), "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def _json_default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def serialize(payload):
+    """Serialize a response payload to compact UTF-8 JSON"""
+    return json.dumps(payload, default=_json_default, ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches `etag`"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def cache_key(path, query_params, case_insensitive=("query",)):
+    """Normalize a request into a cache key.
+
+    Parameter order and empty values do not matter; the search text is
+    matched case-insensitively, so its case does not either.
+    """
+    items = []
+    for name, value in sorted(query_params.items()):
+        if value is None or value == "":
+            continue
+        if name in case_insensitive:
+            value = value.strip().casefold()
+        items.append((name, value))
+    return path, tuple(items)
+
+
+class CachedResponse:
+    __slots__ = ("version", "expires_at", "body", "etag")
+
+    def __init__(self, version, expires_at, body):
+        self.version = version
+        self.expires_at = expires_at
+        self.body = body
+        self.etag = make_etag(body)
+
+
+class ResponseCache:
+    """LRU of serialized response bodies bounded by entry count and bytes"""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version or entry.expires_at < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, version, body):
+        entry = CachedResponse(version, time.monotonic() + self.ttl, body)
+        if len(body) > self.max_bytes:
+            return entry
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += len(body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def _remove(self, key):
+        self._bytes -= len(self._entries.pop(key).body)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+
+class DataVersionTracker:
+    """Follows the catalog data version and notifies listeners when it changes.
+
+    Uses a change stream on ``discounts`` when the server supports one and
+    otherwise polls the version document every `poll_interval` seconds.
+    Listeners run once writes have been quiet for `debounce` seconds, so a
+    catalog ingest that inserts hundreds of documents triggers one rebuild.
+    The version moves both when the data changes and when the listeners
+    finish, so nothing cached from the old in-memory state outlives them.
+    """
+
+    def __init__(self, db, poll_interval=5.0, debounce=2.0):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.version = 0
+        self._stored_version = None
+        self._listeners = []
+        self._tasks = []
+        self._notify_task = None
+        self._running_listeners = False
+        self._rerun = False
+
+    def add_listener(self, callback):
+        """Register `callback()` (sync or async) to run after data changes"""
+        self._listeners.append(callback)
+
+    async def start(self):
+        await self._poll_once()
+        self._tasks = [
+            asyncio.create_task(self._poll()),
+            asyncio.create_task(self._watch()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks + [self._notify_task]:
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in self._tasks if t is not None), return_exceptions=True)
+
+    def _changed(self):
+        self.version += 1
+        if self._notify_task is not None and not self._notify_task.done():
+            if self._running_listeners:
+                # Never cancel a rebuild halfway; run the listeners again after it
+                self._rerun = True
+                return
+            self._notify_task.cancel()
+        self._notify_task = asyncio.create_task(self._notify_later())
+
+    async def _notify_later(self):
+        await asyncio.sleep(self.debounce)
+        self._running_listeners = True
+        self._rerun = False
+        try:
+            for callback in self._listeners:
+                try:
+                    result = callback()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    print(f"Error in data version listener: {str(e)}")
+        finally:
+            self._running_listeners = False
+        # Responses cached since _changed() may have been computed from the
+        # indexes and snapshot the listeners just replaced
+        self.version += 1
+        if self._rerun:
+            self._notify_task = asyncio.create_task(self._notify_later())
+
+    async def _poll_once(self):
+        doc = await self.db.meta.find_one({"_id": DATA_VERSION_ID})
+        stored = doc["version"] if doc else 0
+        if self._stored_version is not None and stored != self._stored_version:
+            self._changed()
+        self._stored_version = stored
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._poll_once()
+            except Exception as e:
+                print(f"Error polling data version: {str(e)}")
+
+    async def _watch(self):
+        try:
+            async with self.db.discounts.watch() as stream:
+                async for _ in stream:
+                    self._changed()
+        except OperationFailure:
+            # Standalone servers have no change streams; polling covers it
+            pass
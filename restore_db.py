@@ -1,9 +1,11 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, ReplaceOne
 import json
 from datetime import datetime
-from bson import ObjectId
 import os
 from dotenv import load_dotenv
+from backup_format import decode_id, iter_documents
+from response_cache import bump_data_version
 
 # Load environment variables
 load_dotenv()
@@ -13,33 +15,31 @@ MONGODB_URL = "connection_url_string"
 client = AsyncIOMotorClient(MONGODB_URL)
 db = client.discount_hunter
 
+MANIFEST_DIR = 'backups/manifests'
+BULK_BATCH_SIZE = 1000
+
 async def restore_collection(collection_name, filename):
-    """Restore a collection from a JSON file"""
+    """Restore a collection from a JSON or BSON backup file"""
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            documents = json.load(f)
-        
         collection = db[collection_name]
         
         # Clear existing collection
         await collection.delete_many({})
         
-        # Convert string IDs back to ObjectId
-        for doc in documents:
-            if '_id' in doc:
-                doc['_id'] = ObjectId(doc['_id'])
-            if 'offer_start_date' in doc:
-                doc['offer_start_date'] = datetime.fromisoformat(doc['offer_start_date'])
-            if 'offer_end_date' in doc:
-                doc['offer_end_date'] = datetime.fromisoformat(doc['offer_end_date'])
-            if 'added_date' in doc:
-                doc['added_date'] = datetime.fromisoformat(doc['added_date'])
+        # Insert documents in batches as they are decoded
+        count = 0
+        batch = []
+        for doc in iter_documents(filename):
+            batch.append(doc)
+            if len(batch) >= BULK_BATCH_SIZE:
+                await collection.insert_many(batch, ordered=False)
+                count += len(batch)
+                batch = []
+        if batch:
+            await collection.insert_many(batch, ordered=False)
+            count += len(batch)
         
-        # Insert documents
-        if documents:
-            await collection.insert_many(documents)
-        
-        print(f"Restored {len(documents)} documents to {collection_name}")
+        print(f"Restored {count} documents to {collection_name}")
         return True
     except Exception as e:
         print(f"Error restoring {collection_name}: {str(e)}")
@@ -57,6 +57,7 @@ async def restore_from_backup(backup_dir='backups'):
             if not await restore_collection(collection, filename):
                 success = False
         
+        await bump_data_version(db)
         if success:
             print("\nDatabase restoration completed successfully!")
         else:
@@ -67,6 +68,94 @@ async def restore_from_backup(backup_dir='backups'):
         print(f"Error during restoration: {str(e)}")
         return False
 
+async def apply_increment(collection_name, filename, tombstones):
+    """Replay one incremental backup file on top of the current collection"""
+    try:
+        collection = db[collection_name]
+        
+        # Changed documents are upserted, so overlapping increments are harmless
+        operations = [
+            ReplaceOne({'_id': doc['_id']}, doc, upsert=True)
+            for doc in iter_documents(filename)
+        ]
+        changed = len(operations)
+        # Deletes go last: a document created and removed inside the same
+        # window must not survive the replay
+        operations.extend(DeleteOne({'_id': decode_id(doc_id)}) for doc_id in tombstones)
+        
+        for i in range(0, len(operations), BULK_BATCH_SIZE):
+            await collection.bulk_write(operations[i:i + BULK_BATCH_SIZE], ordered=True)
+        
+        print(f"Applied {changed} changes and {len(tombstones)} deletions to {collection_name}")
+        return True
+    except Exception as e:
+        print(f"Error applying increment to {collection_name}: {str(e)}")
+        return False
+
+def _load_manifests(manifest_dir):
+    """Load every manifest in the chain keyed by id"""
+    manifests = {}
+    for name in os.listdir(manifest_dir):
+        if name.endswith('.json'):
+            with open(os.path.join(manifest_dir, name), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            manifests[manifest['id']] = manifest
+    return manifests
+
+def _resolve_chain(manifests, until=None):
+    """Return the manifests to replay, full backup first, to reach `until`"""
+    candidates = [
+        m for m in manifests.values()
+        if until is None or datetime.fromisoformat(m['timestamp']) <= until
+    ]
+    if not candidates:
+        return []
+    
+    head = max(candidates, key=lambda m: m['timestamp'])
+    chain = [head]
+    while chain[-1]['parent'] is not None:
+        parent = manifests.get(chain[-1]['parent'])
+        if parent is None:
+            raise ValueError(f"Backup chain is broken: missing manifest {chain[-1]['parent']}")
+        chain.append(parent)
+    chain.reverse()
+    return chain
+
+async def restore_to_point(until=None, manifest_dir=MANIFEST_DIR):
+    """Restore the full backup and replay increments up to `until` (default: latest)"""
+    try:
+        if not os.path.exists(manifest_dir):
+            print("No backup manifests found!")
+            return False
+        
+        chain = _resolve_chain(_load_manifests(manifest_dir), until)
+        if not chain:
+            print("No backup found before the requested point in time!")
+            return False
+        
+        success = True
+        base, increments = chain[0], chain[1:]
+        print(f"Restoring base backup {base['id']} and {len(increments)} increments")
+        for collection, entry in base['collections'].items():
+            if not await restore_collection(collection, entry['file']):
+                success = False
+        
+        for manifest in increments:
+            for collection, entry in manifest['collections'].items():
+                if not await apply_increment(collection, entry['file'], entry['tombstones']):
+                    success = False
+        
+        await bump_data_version(db)
+        if success:
+            print(f"\nDatabase restored to {chain[-1]['timestamp']} successfully!")
+        else:
+            print("\nDatabase restoration completed with some errors.")
+        
+        return success
+    except Exception as e:
+        print(f"Error during restoration: {str(e)}")
+        return False
+
 async def restore_latest_backup():
     """Restore from the most recent backup"""
     backup_dir = 'backups'
@@ -89,4 +178,12 @@ async def restore_latest_backup():
 
 if __name__ == "__main__":
     import asyncio
-    asyncio.run(restore_latest_backup()) 
\ No newline at end of file
+    import sys
+    if '--until' in sys.argv:
+        # e.g. python restore_db.py --until 2025-04-13T12:00:00
+        until = datetime.fromisoformat(sys.argv[sys.argv.index('--until') + 1])
+        asyncio.run(restore_to_point(until))
+    elif '--chain' in sys.argv:
+        asyncio.run(restore_to_point())
+    else:
+        asyncio.run(restore_latest_backup()) 
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""Columnar in-memory snapshot of live discounts for filter and sort queries.
+
+The live offers fit comfortably in memory, so /api/search requests that
+only filter on store, discount and price and sort by one of the known keys
+can be answered without Mongo. The columns are NumPy arrays; filters become
+vectorized boolean masks and each sort order is a permutation computed once
+per snapshot, so a query costs a few passes over contiguous arrays plus
+building the returned page. Snapshots are immutable and the API swaps in a
+new one after each ingest.
+"""
+import asyncio
+from datetime import datetime
+
+import numpy as np
+
+SORT_KEYS = ("price", "store", "date", "trending")
+
+
+class DiscountSnapshot:
+    def __init__(self, documents, built_at=None):
+        self.built_at = built_at or datetime.utcnow()
+        self.documents = []
+        for doc in documents:
+            doc = dict(doc)
+            doc["_id"] = str(doc["_id"])
+            if doc.get("bounding_box"):
+                doc["bounding_box"] = dict(doc["bounding_box"])
+            self.documents.append(doc)
+
+        def column(field, dtype, missing):
+            return np.array([
+                missing if d.get(field) is None else d[field] for d in self.documents
+            ], dtype=dtype)
+
+        self.price = column("discount_price", np.float64, np.nan)
+        self.discount = column("discount_percentage", np.float64, np.nan)
+        self.trending = column("trending_score", np.int64, 0)
+        self.end = np.array(
+            [d.get("offer_end_date") or datetime.max for d in self.documents], dtype="datetime64[us]"
+        )
+        # Stores as a categorical; categories are sorted so code order is name order
+        self.stores, self.store_codes = np.unique(
+            np.array([d.get("store") or "" for d in self.documents], dtype=object).astype(str),
+            return_inverse=True
+        )
+        self.store_index = {store: code for code, store in enumerate(self.stores.tolist())}
+
+        # Mongo sorts missing values first in ascending order; -inf does the same
+        price_key = np.where(np.isnan(self.price), -np.inf, self.price)
+        self.orders = {
+            "price": np.argsort(price_key, kind="stable"),
+            "store": np.argsort(self.store_codes, kind="stable"),
+            "date": np.argsort(self.end, kind="stable"),
+            "trending": np.argsort(-self.trending, kind="stable"),
+        }
+
+    def __len__(self):
+        return len(self.documents)
+
+    def supports(self, sort_by):
+        return sort_by is None or sort_by in SORT_KEYS
+
+    def mask(self, store=None, min_discount=None, max_price=None, now=None):
+        now = np.datetime64(now or datetime.utcnow(), "us")
+        mask = self.end > now
+        if store:
+            code = self.store_index.get(store)
+            if code is None:
+                return np.zeros(len(self.documents), dtype=bool)
+            mask &= self.store_codes == code
+        with np.errstate(invalid="ignore"):
+            if min_discount:
+                mask &= self.discount >= min_discount
+            if max_price:
+                mask &= self.price <= max_price
+        return mask
+
+    def search(self, store=None, min_discount=None, max_price=None, sort_by=None,
+               limit=500, offset=0, now=None):
+        """Same response shape as the Mongo-backed search"""
+        mask = self.mask(store, min_discount, max_price, now)
+        total = int(np.count_nonzero(mask))
+        if sort_by in self.orders:
+            order = self.orders[sort_by]
+            selected = order[mask[order]]
+        else:
+            selected = np.flatnonzero(mask)
+        page = selected[offset:offset + limit]
+        return {
+            "items": [dict(self.documents[i]) for i in page],
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "has_more": (offset + limit) < total
+        }
+
+
+async def load_snapshot(collection):
+    """Read live discounts and build a snapshot off the event loop"""
+    now = datetime.utcnow()
+    documents = await collection.find({"offer_end_date": {"$gt": now}}).sort("_id", 1).to_list(length=None)
+    return await asyncio.to_thread(DiscountSnapshot, documents, now)
@@ -0,0 +1,92 @@
+"""Prefix suggestions for the search box.
+
+Normalized product names and each of their words are kept in one sorted
+array, so all terms with a prefix form a contiguous range found with two
+binary searches. Each term points at the product label it came from.
+Labels are weighted by trending score plus the number of live offers.
+Answers for prefixes of up to ``PRECOMPUTED_PREFIX`` characters, whose
+ranges are the widest, are computed at build time.
+"""
+import heapq
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from trigram_index import normalize
+
+PRECOMPUTED_PREFIX = 3
+MIN_TOKEN_LENGTH = 2
+MAX_SUGGESTIONS = 10
+
+
+class SuggestIndex:
+    def __init__(self, labels, weights, terms, term_labels):
+        self.labels = labels
+        self.weights = weights
+        self.terms = terms
+        self.term_labels = term_labels
+        self._top = self._precompute()
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def from_documents(cls, documents, now=None):
+        """Build from discount documents, counting only offers still live at `now`"""
+        now = now or datetime.utcnow()
+        live_offers = Counter()
+        trending = Counter()
+        spellings = defaultdict(Counter)
+        for doc in documents:
+            end = doc.get("offer_end_date")
+            if end is not None and end <= now:
+                continue
+            name = doc.get("item_description")
+            key = doc.get("normalized_name") or normalize(name)
+            if not key:
+                continue
+            live_offers[key] += 1
+            trending[key] = max(trending[key], doc.get("trending_score") or 0)
+            spellings[key][" ".join(str(name).split())] += 1
+
+        keys = list(live_offers)
+        # Show the most common original spelling of each product
+        labels = [spellings[key].most_common(1)[0][0] for key in keys]
+        weights = [trending[key] + live_offers[key] for key in keys]
+
+        entries = set()
+        for label_id, key in enumerate(keys):
+            entries.add((key, label_id))
+            for token in key.split():
+                if len(token) >= MIN_TOKEN_LENGTH:
+                    entries.add((token, label_id))
+        entries = sorted(entries)
+        return cls(labels, weights, [t for t, _ in entries], [l for _, l in entries])
+
+    def _precompute(self):
+        best = defaultdict(dict)
+        for term, label_id in zip(self.terms, self.term_labels):
+            for length in range(1, min(PRECOMPUTED_PREFIX, len(term)) + 1):
+                best[term[:length]][label_id] = self.weights[label_id]
+        return {
+            prefix: heapq.nlargest(MAX_SUGGESTIONS, candidates, key=lambda l: (candidates[l], -l))
+            for prefix, candidates in best.items()
+        }
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        """Top product labels for `prefix`, highest weight first"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        limit = min(limit, MAX_SUGGESTIONS)
+        if len(prefix) <= PRECOMPUTED_PREFIX:
+            label_ids = self._top.get(prefix, [])[:limit]
+        else:
+            lo = bisect_left(self.terms, prefix)
+            hi = bisect_left(self.terms, prefix + "\uffff", lo)
+            candidates = set(self.term_labels[lo:hi])
+            label_ids = heapq.nlargest(limit, candidates, key=lambda l: (self.weights[l], -l))
+        return [{"text": self.labels[l], "weight": self.weights[l]} for l in label_ids]
+
+
+EMPTY = SuggestIndex([], [], [], [])
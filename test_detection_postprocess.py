@@ -0,0 +1,37 @@
+from detection_postprocess import OfferDateParser, postprocess
+
+
+def detection(ymin, xmin, ymax, xmax, **fields):
+    return dict(ymin=ymin, xmin=xmin, ymax=ymax, xmax=xmax, **fields)
+
+
+def test_duplicate_boxes_are_merged_and_bad_boxes_dropped():
+    detections = [
+        detection(100, 100, 300, 300, label="Banane", price="1.29"),
+        detection(105, 98, 302, 296, label="Banane", price="1.29", discount="-30%"),
+        detection(100, 400, 300, 600, label="Mleko", price="0.99"),
+        detection(500, 500, 500, 700, label="Flat"),
+        {"label": "No box"},
+        detection(-50, 900, 200, 1200, label="Kava"),
+    ]
+
+    products, stats = postprocess(detections, width=1000, height=2000)
+
+    assert stats == {"invalid": 2, "suppressed": 1}
+    assert [p["name"] for p in products] == ["Banane", "Mleko", "Kava"]
+    banane = products[0]
+    assert banane["bbox"] == [98, 200, 300, 604]
+    assert banane["discount"] == "-30%"
+    # Clipped to the page
+    assert products[2]["bbox"] == [900, 0, 1000, 400]
+
+
+def test_offer_dates_are_parsed_and_memoized():
+    parser = OfferDateParser("2025-04-10", "2025-04-20")
+
+    assert parser.parse("10.4.-16.4.") == ("2025-04-10", "2025-04-16")
+    assert parser.parse("10.-16.5.") == ("2025-05-10", "2025-05-16")
+    assert parser.parse("17.4.") == ("2025-04-17", "2025-04-17")
+    assert parser.parse("") == ("2025-04-10", "2025-04-20")
+    assert parser.parse("velja do preklica") == ("2025-04-10", "2025-04-20")
+    assert len(parser._memo) == 4
@@ -0,0 +1,52 @@
+import time
+
+from ingest_worker import Heartbeat
+
+
+class StubQueue:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.beats = 0
+
+    def heartbeat(self, job_id, worker_id):
+        self.beats += 1
+        return self.alive
+
+
+def test_heartbeat_extends_the_lease_until_stopped():
+    queue = StubQueue()
+    heartbeat = Heartbeat(queue, "job", "worker", interval=0.01)
+
+    heartbeat.start()
+    time.sleep(0.05)
+    heartbeat.stop()
+
+    assert not heartbeat.is_alive()
+    assert queue.beats > 0
+    assert not heartbeat.lost
+
+
+def test_heartbeat_notices_a_lost_lease():
+    heartbeat = Heartbeat(StubQueue(alive=False), "job", "worker", interval=0.01)
+
+    heartbeat.start()
+    heartbeat.join(1)
+    heartbeat.stop()
+
+    assert heartbeat.lost
+
+
+class FailingQueue:
+    def heartbeat(self, job_id, worker_id):
+        raise ConnectionError("mongo unreachable")
+
+
+def test_heartbeat_counts_the_lease_lost_once_it_could_have_expired():
+    heartbeat = Heartbeat(FailingQueue(), "job", "worker", interval=0.01, lease_seconds=0.05)
+
+    heartbeat.start()
+    assert not heartbeat.lost
+    time.sleep(0.1)
+    heartbeat.stop()
+
+    assert heartbeat.lost
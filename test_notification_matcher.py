@@ -0,0 +1,60 @@
+from notification_matcher import FakeSink, WatchIndex, WatchRule, deliver_matches
+
+
+def discount(_id, name, store="Lidl", price=1.0):
+    return {"_id": _id, "item_description": name, "store": store, "discount_price": price}
+
+
+def test_keyword_rules_respect_store_and_price():
+    watchers = [
+        {"user_id": "ana", "device_id": "d1", "keywords": ["banane"], "stores": ["Spar"]},
+        {"user_id": "bor", "device_id": "d2", "keywords": ["Svinjski filé"], "max_price": 6},
+    ]
+    new = [
+        discount("1", "Banane", store="Lidl"),
+        discount("2", "Banane", store="Spar"),
+        discount("3", "Svinjski file", price=5.99),
+        discount("4", "Svinjski file", price=8.49),
+    ]
+    sink = FakeSink()
+
+    sent = deliver_matches(watchers, {}, new, sink)
+
+    assert sent == 2
+    by_user = {n["user_id"]: n for n in sink.notifications}
+    assert by_user["ana"]["discount_ids"] == ["2"]
+    assert by_user["bor"]["discount_ids"] == ["3"]
+
+
+def test_cart_items_match_cheaper_offers_elsewhere():
+    watchers = [{"user_id": "ana", "device_id": "d1"}]
+    cart = {"ana": [discount("10", "Mleko 3,5 %", price=1.09)]}
+    new = [
+        discount("10", "Mleko 3,5 %", price=1.09),
+        discount("11", "Mleko 3,5 %", store="Hofer", price=0.89),
+        discount("12", "Mleko 3,5 %", store="Spar", price=1.29),
+    ]
+    sink = FakeSink()
+
+    deliver_matches(watchers, cart, new, sink)
+
+    [notification] = sink.notifications
+    assert notification["discount_ids"] == ["11"]
+    assert notification["sources"] == ["cart"]
+
+
+def test_all_rule_tokens_must_be_present():
+    index = WatchIndex([WatchRule("ana", ["trajno", "mleko"])])
+
+    matches = index.match([discount("1", "Mleko"), discount("2", "Trajno mleko 1 l")])
+
+    assert list(matches["ana"]) == ["2"]
+
+
+def test_notifications_are_delivered_in_batches():
+    watchers = [{"user_id": f"u{i}", "device_id": f"d{i}", "keywords": ["kava"]} for i in range(5)]
+    sink = FakeSink()
+
+    deliver_matches(watchers, {}, [discount("1", "Kava mleta")], sink, batch_size=2)
+
+    assert [len(batch) for batch in sink.batches] == [2, 2, 1]
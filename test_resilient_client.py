@@ -0,0 +1,68 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from resilient_client import CircuitBreaker, ModelCallError, ResilientModelClient
+
+
+class ScriptedClient:
+    """Answers each call with the next scripted step: text, an exception or a delay"""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.calls = 0
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+
+    def generate_content(self, model, contents):
+        step = self.steps[min(self.calls, len(self.steps) - 1)]
+        self.calls += 1
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, float):
+            time.sleep(step)
+            step = "[]"
+        return SimpleNamespace(text=step)
+
+
+def parse(response):
+    return json.loads(response.text)
+
+
+def make_client(steps, **options):
+    options.setdefault("sleep", lambda seconds: None)
+    return ResilientModelClient(ScriptedClient(steps), **options)
+
+
+def test_malformed_answers_are_requested_again():
+    client = make_client(['[{"ymin": 1', '[{"ymin": 1}]'])
+
+    result = client.generate("model", "page", parse=parse)
+
+    assert result.value == [{"ymin": 1}]
+    assert result.attempts == 2
+    assert client.stats()["malformed"] == 1
+
+
+def test_slow_attempts_are_abandoned_at_the_deadline():
+    client = make_client([0.5, "[]"], deadline=0.05)
+
+    result = client.generate("model", "page", parse=parse)
+
+    assert result.attempts == 2
+    assert client.stats()["timeouts"] == 1
+    client.close()
+
+
+def test_gives_up_and_opens_the_breaker_after_repeated_errors():
+    breaker = CircuitBreaker(window=4, min_calls=4, cooldown=60)
+    client = make_client([RuntimeError("503")], max_attempts=4, breaker=breaker)
+
+    with pytest.raises(ModelCallError) as error:
+        client.generate("model", "page", parse=parse)
+
+    assert error.value.attempts == 4
+    assert breaker.opens == 1
+    assert breaker.wait_time() > 0
+    assert client.stats()["attempts_per_call"] == {4: 1}
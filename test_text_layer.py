@@ -0,0 +1,51 @@
+import fitz
+
+import text_layer
+
+
+def tile(page, x, y, name, offer, regular=None, regular_size=9):
+    """A product tile: photo, name, offer price and optionally a regular price beside it"""
+    page.draw_rect(fitz.Rect(x, y, x + 150, y + 100), color=(0.2, 0.5, 0.2), fill=(0.2, 0.5, 0.2))
+    page.insert_text((x + 4, y + 120), name, fontsize=11)
+    page.insert_text((x + 80, y + 150), offer, fontsize=16)
+    if regular:
+        page.insert_text((x + 4, y + 150), regular, fontsize=regular_size)
+        page.draw_line((x + 2, y + 147), (x + 30, y + 147))
+
+
+def read(tiles):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    for args in tiles:
+        tile(page, *args)
+    return text_layer.read_page(page)
+
+
+def test_regular_price_is_grouped_with_the_offer_price():
+    page_text = read([(40, 40, "Banane", "1,99", "2,49"), (300, 40, "Mleko", "0,89")])
+
+    assert page_text.covered
+    products = [p.to_product(300 / 72) for p in page_text.products]
+    assert [(p["name"], p["price"], p["discount"]) for p in products] == [
+        ("Banane", "1.99", "-20%"),
+        ("Mleko", "0.89", ""),
+    ]
+
+
+def test_prices_in_the_same_font_are_not_trusted():
+    page_text = read([(40, 40, "Banane", "1,99", "2,49", 16)])
+
+    assert not page_text.covered
+    assert len(page_text.products) == 2
+
+
+def test_model_boxes_do_not_turn_regular_prices_into_products():
+    page_text = read([(40, 40, "Banane", "1,99", "2,49"), (300, 40, "Mleko", "0,89")])
+    scale = 300 / 72
+    box = [int(v * scale) for v in (35, 35, 200, 200)]
+
+    products, unmatched = text_layer.merge_detections(page_text, [box], scale)
+
+    assert unmatched == 0
+    assert [(p["name"], p["price"]) for p in products] == [("Banane", "1.99"), ("Mleko", "0.89")]
+    assert products[0]["bbox"] == box
@@ -0,0 +1,304 @@
+"""Read products straight from the text layer of a catalog PDF page.
+
+Most retailer PDFs are typeset, so prices, names, quantities and validity
+dates are real text with coordinates. ``read_page`` classifies the lines of
+PyMuPDF's ``get_text("dict")`` output, pairs every price with the nearest
+name, quantity, discount and date lines, and grows each product's box over
+the pictures next to it (image blocks and large filled drawings) so the box
+can be cropped like a model detection.
+
+Retail tiles often print the struck-out regular price next to the offer
+price. Prices close to each other are grouped: the one in the largest font
+is the offer, the smaller one its regular price (and the discount when none
+is printed). Neighbouring prices in the same font cannot be told apart.
+
+A page is *covered* when every offer price found a name and no price group
+was ambiguous; those pages need no model call. Otherwise the model is only asked for boxes and
+``merge_detections`` fills them in with the text from the layer.
+"""
+import math
+import re
+
+from price_compare import parse_quantity
+
+_PRICE = re.compile(r"^(\d{1,4})(?:\s?[,.]\s?|\s)(\d{2})\s*(?:€|eur)?$", re.IGNORECASE)
+_DATE = re.compile(r"\b\d{1,2}\.\s?(?:\d{1,2}\.?)?\s?[-–]\s?\d{1,2}\.|\bvelja\b", re.IGNORECASE)
+_DISCOUNT = re.compile(r"\d{1,2}\s?%")
+_LETTERS = re.compile(r"[^\W\d_]{2}")
+
+# Lines further apart than this fraction of the page height are never paired
+MAX_GAP = 0.15
+# Product text reads top to bottom and left to right with the price last, so
+# lines right of or below a price are counted this many times further away
+BEHIND_PENALTY = 3
+# Filled shapes smaller than this fraction of the page are decoration, larger
+# than MAX_VISUAL they are backgrounds
+MIN_VISUAL = 0.002
+MAX_VISUAL = 0.5
+# A price within this many font sizes of an offer price belongs to the same
+# product; it is the regular price if its font is at most REGULAR_SIZE times
+# the offer's
+PRICE_GROUP_GAP = 5
+REGULAR_SIZE = 0.9
+
+
+class Line:
+    __slots__ = ("text", "rect", "size", "block")
+
+    def __init__(self, text, rect, size, block):
+        self.text = text
+        self.rect = rect
+        self.size = size
+        self.block = block
+
+
+class LayerProduct:
+    __slots__ = ("price", "regular_price", "name", "quantity", "discount", "date", "visuals")
+
+    def __init__(self, price, regular_price=None):
+        self.price = price
+        self.regular_price = regular_price
+        self.name = None
+        self.quantity = None
+        self.discount = None
+        self.date = None
+        self.visuals = []
+
+    def rect(self):
+        lines = (self.price, self.regular_price, self.name, self.quantity, self.discount)
+        rects = [line.rect for line in lines if line]
+        return _union(rects + self.visuals)
+
+    def to_product(self, scale, rect=None):
+        """The product in CatalogProcessor's format, with the box in pixels"""
+        x0, y0, x1, y1 = rect or [v * scale for v in self.rect()]
+        return {
+            "bbox": [int(x0), int(y0), int(math.ceil(x1)), int(math.ceil(y1))],
+            "name": self.name.text if self.name else "Unknown Product",
+            "price": price_value(self.price.text),
+            "quantity": self.quantity.text if self.quantity else "",
+            "description": "",
+            "discount": self.discount.text if self.discount else self._implied_discount(),
+            "validity_date": self.date.text if self.date else "",
+        }
+
+    def _implied_discount(self):
+        """-N% from the regular price when the tile prints no discount"""
+        if self.regular_price is None:
+            return ""
+        try:
+            offer = float(price_value(self.price.text))
+            regular = float(price_value(self.regular_price.text))
+        except ValueError:
+            return ""
+        if regular <= offer:
+            return ""
+        return f"-{round((1 - offer / regular) * 100)}%"
+
+
+class PageText:
+    __slots__ = ("products", "covered")
+
+    def __init__(self, products, covered):
+        # LayerProducts in PDF points
+        self.products = products
+        self.covered = covered
+
+    @property
+    def has_prices(self):
+        return bool(self.products)
+
+
+def price_value(text):
+    match = _PRICE.match(text.strip())
+    return f"{match.group(1)}.{match.group(2)}" if match else text
+
+
+def classify(text):
+    if _PRICE.match(text):
+        return "price"
+    if _DATE.search(text):
+        return "date"
+    if _DISCOUNT.search(text):
+        return "discount"
+    if len(text) <= 20 and parse_quantity(text)[1] is not None:
+        return "quantity"
+    if _LETTERS.search(text):
+        return "name"
+    return None
+
+
+def _union(rects):
+    return (min(r[0] for r in rects), min(r[1] for r in rects),
+            max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+def _gap(a, b):
+    """Distance between the closest edges of two rects, 0 if they overlap"""
+    dx = max(0, b[0] - a[2], a[0] - b[2])
+    dy = max(0, b[1] - a[3], a[1] - b[3])
+    return math.hypot(dx, dy)
+
+
+def _lines(page_dict):
+    lines = []
+    for block_no, block in enumerate(page_dict["blocks"]):
+        for line in block.get("lines", []):
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            text = " ".join(span["text"].strip() for span in spans)
+            lines.append(Line(text, tuple(line["bbox"]), max(span["size"] for span in spans), block_no))
+    return lines
+
+
+def _merge_names(lines):
+    """Join name lines that continue each other within a block"""
+    merged = []
+    for line in lines:
+        previous = merged[-1] if merged else None
+        if (previous is not None and previous.block == line.block
+                and abs(previous.size - line.size) < 0.5
+                and line.rect[1] - previous.rect[3] < line.size):
+            merged[-1] = Line(previous.text + " " + line.text, _union([previous.rect, line.rect]),
+                              previous.size, previous.block)
+        else:
+            merged.append(line)
+    return merged
+
+
+def _distance(price, line):
+    """Gap from a price to a line, penalised for lines behind the price"""
+    distance = _gap(price, line)
+    if line[0] >= price[2]:
+        distance *= BEHIND_PENALTY
+    if line[1] >= price[3]:
+        distance *= BEHIND_PENALTY
+    return distance
+
+
+def _group_prices(prices):
+    """Offer prices with their regular price, and whether any group was ambiguous.
+
+    Largest fonts first, each offer takes the nearest unused price within
+    PRICE_GROUP_GAP font sizes. A neighbour in (nearly) the same font could
+    be either price, so both stay offers and the page is flagged.
+    """
+    products = []
+    used = set()
+    ambiguous = False
+    order = sorted(range(len(prices)), key=lambda i: -prices[i].size)
+    for i in order:
+        if i in used:
+            continue
+        used.add(i)
+        offer = prices[i]
+        neighbours = sorted(
+            (_gap(offer.rect, prices[j].rect), j) for j in order
+            if j not in used and _gap(offer.rect, prices[j].rect) <= PRICE_GROUP_GAP * offer.size
+        )
+        regular = None
+        if neighbours:
+            j = neighbours[0][1]
+            if prices[j].size <= offer.size * REGULAR_SIZE:
+                regular = prices[j]
+                used.add(j)
+            else:
+                ambiguous = True
+        products.append(LayerProduct(offer, regular))
+    # Keep the page's reading order
+    products.sort(key=lambda product: (product.price.rect[1], product.price.rect[0]))
+    return products, ambiguous
+
+
+def _pair(products, lines, attribute, max_gap, unique=True):
+    """Give each product its nearest line, greedily closest pair first"""
+    pairs = sorted(
+        (_distance(product.price.rect, line.rect), i, j)
+        for i, product in enumerate(products)
+        for j, line in enumerate(lines)
+    )
+    used = set()
+    for gap, i, j in pairs:
+        if gap > max_gap:
+            break
+        if getattr(products[i], attribute) is not None or (unique and j in used):
+            continue
+        setattr(products[i], attribute, lines[j])
+        used.add(j)
+
+
+def _visuals(page, page_dict, page_area):
+    rects = [tuple(block["bbox"]) for block in page_dict["blocks"] if block.get("type") == 1]
+    rects.extend(tuple(drawing["rect"]) for drawing in page.get_drawings() if drawing.get("fill"))
+    visuals = []
+    for rect in rects:
+        area = (rect[2] - rect[0]) * (rect[3] - rect[1])
+        if MIN_VISUAL * page_area <= area <= MAX_VISUAL * page_area:
+            visuals.append(rect)
+    return visuals
+
+
+def read_page(page):
+    """Extract the priced products of a ``fitz.Page`` from its text layer"""
+    page_dict = page.get_text("dict")
+    width, height = page.rect.width, page.rect.height
+    max_gap = MAX_GAP * height
+
+    by_kind = {"price": [], "name": [], "quantity": [], "discount": [], "date": []}
+    for line in _lines(page_dict):
+        kind = classify(line.text)
+        if kind:
+            by_kind[kind].append(line)
+
+    products, ambiguous = _group_prices(by_kind["price"])
+    _pair(products, _merge_names(by_kind["name"]), "name", max_gap)
+    _pair(products, by_kind["quantity"], "quantity", max_gap)
+    _pair(products, by_kind["discount"], "discount", max_gap)
+    # One validity line often serves a whole page
+    _pair(products, by_kind["date"], "date", math.inf, unique=False)
+
+    if products:
+        text_rects = [product.rect() for product in products]
+        for visual in _visuals(page, page_dict, width * height):
+            gaps = [_gap(visual, rect) for rect in text_rects]
+            nearest = min(range(len(gaps)), key=gaps.__getitem__)
+            if gaps[nearest] <= max_gap:
+                products[nearest].visuals.append(visual)
+
+    covered = (bool(products) and not ambiguous
+               and all(product.name is not None for product in products))
+    return PageText(products, covered)
+
+
+def merge_detections(page_text, boxes, scale):
+    """Fill model boxes (pixels) with text from the layer.
+
+    Each box takes the product whose offer price lies inside it, largest
+    font first. Named layer products outside every box keep their own box.
+    Returns the products and the number of boxes no price fell into.
+    """
+    products = []
+    claimed = set()
+    unmatched = 0
+    candidates = sorted(enumerate(page_text.products), key=lambda item: -item[1].price.size)
+    for box in boxes:
+        match = None
+        for index, product in candidates:
+            if index in claimed:
+                continue
+            x0, y0, x1, y1 = product.price.rect
+            cx, cy = (x0 + x1) / 2 * scale, (y0 + y1) / 2 * scale
+            if box[0] <= cx <= box[2] and box[1] <= cy <= box[3]:
+                match = index
+                break
+        if match is None:
+            unmatched += 1
+            continue
+        claimed.add(match)
+        products.append(page_text.products[match].to_product(scale, rect=box))
+
+    for index, product in enumerate(page_text.products):
+        if index not in claimed and product.name is not None:
+            products.append(product.to_product(scale))
+    return products, unmatched
@@ -0,0 +1,156 @@
+"""On-demand product thumbnails cropped from stored catalog page rasters.
+
+CatalogProcessor keeps every rendered page under
+``PAGE_STORE_DIR/{catalog_id}/page_{n}.png`` and records ``catalog_id`` and
+``page_number`` on each discount. A thumbnail is the discount's bounding
+box cropped from that page (with the same padding as the processor's
+crops), scaled to the requested width and encoded as WebP. Encoded results
+are kept in a two-level LRU: a small in-memory one in front of a larger one
+on disk, both bounded by total bytes. The ETag is derived from the inputs,
+so a revalidation is answered before anything is decoded.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+PAGE_STORE_DIR = os.getenv("PAGE_STORE_DIR", "page_store")
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", "thumbnail_cache")
+
+MIN_WIDTH = 32
+MAX_WIDTH = 1024
+WIDTH_STEP = 32
+PADDING = 100
+WEBP_QUALITY = 80
+# Bump when the rendering changes so old ETags and cache files are not reused
+RENDER_VERSION = 1
+
+
+def page_path(catalog_id, page_number, root=PAGE_STORE_DIR):
+    return os.path.join(root, str(catalog_id), f"page_{page_number}.png")
+
+
+def normalize_width(width):
+    """Clamp and round widths up to a step so the number of variants stays small"""
+    width = max(MIN_WIDTH, min(MAX_WIDTH, int(width)))
+    return -(-width // WIDTH_STEP) * WIDTH_STEP
+
+
+def thumbnail_key(discount):
+    """Cache key and strong ETag for a discount's thumbnail at a width"""
+    box = discount["bounding_box"]
+    source = "|".join(str(v) for v in (
+        RENDER_VERSION, discount["catalog_id"], discount["page_number"],
+        box["x"], box["y"], box["width"], box["height"],
+    ))
+    return hashlib.blake2b(source.encode(), digest_size=12).hexdigest()
+
+
+def render_thumbnail(path, bounding_box, width):
+    """Crop the padded box out of the page, resize it to `width` and encode it as WebP"""
+    with Image.open(path) as page:
+        page_width, page_height = page.size
+        x1 = max(0, int(bounding_box["x"]) - PADDING)
+        y1 = max(0, int(bounding_box["y"]) - PADDING)
+        x2 = min(page_width, int(bounding_box["x"] + bounding_box["width"]) + PADDING)
+        y2 = min(page_height, int(bounding_box["y"] + bounding_box["height"]) + int(PADDING * 1.5))
+        if x1 >= x2 or y1 >= y2:
+            raise ValueError("Bounding box lies outside the page")
+        crop = page.crop((x1, y1, x2, y2))
+    if crop.mode not in ("RGB", "RGBA"):
+        crop = crop.convert("RGB")
+    if crop.width > width:
+        height = max(1, round(crop.height * width / crop.width))
+        crop = crop.resize((width, height), Image.LANCZOS)
+    output = io.BytesIO()
+    crop.save(output, format="WEBP", quality=WEBP_QUALITY, method=4)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    """Byte-bounded LRU in memory in front of a byte-bounded LRU on disk"""
+
+    def __init__(self, directory=THUMBNAIL_CACHE_DIR, memory_bytes=32 * 1024 * 1024,
+                 disk_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # name -> size, oldest first; rebuilt from mtimes after a restart
+        files = []
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith(".webp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self._disk = OrderedDict((name, size) for _, name, size in sorted(files))
+        self._disk_size = sum(self._disk.values())
+
+    def _remember(self, name, data):
+        if len(data) > self.memory_bytes:
+            return
+        if name in self._memory:
+            self._memory_size -= len(self._memory.pop(name))
+        self._memory[name] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, name):
+        with self._lock:
+            data = self._memory.get(name)
+            if data is not None:
+                self._memory.move_to_end(name)
+                return data
+            if name not in self._disk:
+                return None
+            self._disk.move_to_end(name)
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._disk_size -= self._disk.pop(name, 0)
+            return None
+        with self._lock:
+            self._remember(name, data)
+        return data
+
+    def put(self, name, data):
+        path = os.path.join(self.directory, name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        evicted = []
+        with self._lock:
+            self._remember(name, data)
+            self._disk_size += len(data) - self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                old_name, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except FileNotFoundError:
+                pass
+
+    def get_or_render(self, discount, width):
+        """Encoded thumbnail bytes for a discount, rendering on a miss"""
+        name = f"{thumbnail_key(discount)}_{width}.webp"
+        data = self.get(name)
+        if data is None:
+            path = page_path(discount["catalog_id"], discount["page_number"])
+            data = render_thumbnail(path, discount["bounding_box"], width)
+            self.put(name, data)
+        return data
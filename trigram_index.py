@@ -0,0 +1,112 @@
+"""Typo-tolerant product name search over character trigrams.
+
+Names are normalized (accents folded, case-folded, punctuation dropped) so
+"Svinjski filé" and "svinjski file" compare equal, then split into
+pg_trgm-style trigrams. Similarity is the Jaccard index of the two trigram
+sets. Posting lists are kept as compact int32 arrays and scored in one
+``numpy.bincount``, so a query over a million names stays in the low
+milliseconds.
+"""
+import re
+import unicodedata
+from array import array
+
+import numpy as np
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text):
+    """Fold a product name to lowercase ASCII-ish words separated by spaces"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return " ".join(_NON_WORD.sub(" ", text).replace("_", " ").split())
+
+
+def trigrams(normalized):
+    """The set of trigrams of each word, padded like pg_trgm"""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    def __init__(self):
+        self.doc_ids = []
+        self._positions = {}
+        self._sizes = array("i")
+        self._alive = bytearray()
+        self._postings = {}
+        # Highest ObjectId loaded so far, for incremental refreshes
+        self.last_id = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def add(self, doc_id, name):
+        doc_id = str(doc_id)
+        if doc_id in self._positions:
+            return
+        grams = trigrams(normalize(name))
+        position = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self._positions[doc_id] = position
+        self._sizes.append(len(grams))
+        self._alive.append(1)
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting is None:
+                posting = self._postings[gram] = array("i")
+            posting.append(position)
+
+    def remove(self, doc_id):
+        position = self._positions.pop(str(doc_id), None)
+        if position is not None:
+            self._alive[position] = 0
+
+    def search(self, query, threshold=0.3, limit=50):
+        """Return up to `limit` (doc_id, similarity) pairs, best first"""
+        query_grams = trigrams(normalize(query))
+        postings = [self._postings[g] for g in query_grams if g in self._postings]
+        if not postings or not self.doc_ids:
+            return []
+
+        hits = np.concatenate([np.frombuffer(p, dtype=np.int32) for p in postings])
+        shared = np.bincount(hits, minlength=len(self.doc_ids))
+        candidates = np.flatnonzero(shared)
+        shared = shared[candidates]
+        sizes = np.frombuffer(self._sizes, dtype=np.int32)[candidates]
+        similarity = shared / (len(query_grams) + sizes - shared)
+
+        alive = np.frombuffer(self._alive, dtype=np.uint8)[candidates].astype(bool)
+        keep = alive & (similarity >= threshold)
+        candidates, similarity = candidates[keep], similarity[keep]
+
+        if len(candidates) > limit:
+            top = np.argpartition(-similarity, limit - 1)[:limit]
+            candidates, similarity = candidates[top], similarity[top]
+        order = np.lexsort((candidates, -similarity))
+        return [(self.doc_ids[c], float(s)) for c, s in zip(candidates[order], similarity[order])]
+
+    async def load_new(self, collection, batch_size=5000):
+        """Add documents inserted since the last load; returns how many were added"""
+        query = {"_id": {"$gt": self.last_id}} if self.last_id is not None else {}
+        projection = {"item_description": 1, "normalized_name": 1}
+        cursor = collection.find(query, projection).sort("_id", 1).batch_size(batch_size)
+        added = 0
+        async for doc in cursor:
+            self.add(doc["_id"], doc.get("normalized_name") or doc.get("item_description"))
+            self.last_id = doc["_id"]
+            added += 1
+        return added
+
+
+async def build_index(collection):
+    """Build a fresh index over every document in `collection`"""
+    index = TrigramIndex()
+    await index.load_new(collection)
+    return index